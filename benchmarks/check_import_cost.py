@@ -0,0 +1,72 @@
+"""
+Import cost of the packages for headless compute jobs.
+
+Every statement runs in a fresh interpreter, the check fails (exit code 1) when it loads one of
+its forbidden modules or when its best import time of several runs is above the limit.
+
+    python benchmarks/check_import_cost.py --max-seconds 0.5
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+
+HEAVY = ['scipy', 'pandas', 'xarray', 'matplotlib', 'statsmodels', 'cartopy', 'PIL', 'numba', 'tqdm']
+
+# (statement, modules it must not load)
+CHECKS = [
+    ('import HYDRO_Stats', HEAVY + ['numpy']),
+    ('from HYDRO_Stats import TrendDetector', HEAVY),
+    ('from HYDRO_Stats import TrendDetector, TrendAccumulator, fieldSignificance', HEAVY),
+    ('import HYDRO_Plot', HEAVY),
+    ('import HYDRO_Log', HEAVY + ['numpy']),
+]
+
+_PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - t0
+print(json.dumps({{'seconds': seconds, 'modules': sorted({{m.split('.')[0] for m in sys.modules}})}}))
+"""
+
+
+def importCost(statement, repeat=5):
+    """
+    Best time of the statement in repeat fresh interpreters, and the top-level modules it loaded.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([SCRIPTS_DIR, os.environ.get('PYTHONPATH', '')]))
+    best, modules = None, None
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', _PROBE.format(statement=statement)], env=env)
+        res = json.loads(out.decode().strip().splitlines()[-1])
+        if best is None or res['seconds'] < best:
+            best = res['seconds']
+        modules = res['modules']
+    return best, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-seconds', type=float, default=0.5, help='limit of the best import time of a statement')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for statement, forbidden in CHECKS:
+        seconds, modules = importCost(statement, args.repeat)
+        loaded = [m for m in forbidden if m in modules]
+        ok = not loaded and seconds <= args.max_seconds
+        failed |= not ok
+        print('{:4s} {:<75s} {:7.3f} s{}'.format('OK' if ok else 'FAIL', statement, seconds,
+                                                  ', loads ' + ', '.join(loaded) if loaded else ''))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmarks of the hot paths of HYDRO_Stats and HYDRO_Generator on synthetic global grids.
+
+Every case records the best and median wall time of several runs, the peak traced memory (tracemalloc,
+allocations made by numpy and python; memory of compiled numba code is not traced)
+and the throughput in grid pixels per second. Results are saved as JSON, and compared
+with a previous file to flag the cases which became slower than the threshold.
+
+    python benchmarks/run_benchmarks.py --grids 1,0.25 --steps 30,365 --out bench_new.json
+    python benchmarks/run_benchmarks.py --compare bench_old.json --threshold 0.2 --min-seconds 0.01
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tempfile
+import platform
+import subprocess
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from HYDRO_Stats import TrendDetector
+from HYDRO_Stats.NumbaKernels import numbaAvailable
+from HYDRO_Generator import LandMask
+from HYDRO_Generator.Feb29 import fill_values_in_Feb29
+from HYDRO_Generator.GlobalGridInfo import FromLatLonGetLandOrSea
+from HYDRO_Generator.Mask import RemoveSeaAsNan
+
+
+def syntheticGrid(resolution, NTime, seed=0):
+    """
+    Cell-centred global lat/lon of a resolution in degrees, and a float32 (time, lat, lon) cube
+    of a linear trend with noise and 5% nan.
+    """
+    lat = np.arange(90 - resolution / 2, -90, -resolution)
+    lon = np.arange(-180 + resolution / 2, 180, resolution)
+    rng = np.random.default_rng(seed)
+    arr = rng.standard_normal((NTime, len(lat), len(lon)), dtype=np.float32)
+    arr += np.linspace(0, 1, NTime, dtype=np.float32)[:, np.newaxis, np.newaxis]
+    arr[rng.random(arr.shape, dtype=np.float32) < 0.05] = np.nan
+    return lat, lon, arr
+
+
+def measure(func, repeat=3):
+    """
+    Best and median wall time of repeat runs after one warm-up run (numba compilation, caches),
+    then the peak traced memory of one more run.
+    """
+    func()
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), float(np.median(times)), peak
+
+
+def coldLandMask(func):
+    """
+    func run with an empty land mask cache, so that the mask computation is timed and not a cache hit.
+    """
+    def run():
+        LandMask.defaultLandMaskCache.clear()
+        return func()
+    return run
+
+
+def buildCases(resolution, NTime, methods, backends, seed=0):
+    """
+    (name, function, number of grid pixels) of every case on one grid.
+    """
+    lat, lon, arr = syntheticGrid(resolution, NTime, seed)
+    NPixel = len(lat) * len(lon)
+    tag = '{}deg_{}t'.format(resolution, NTime)
+    cases = []
+
+    for method in methods:
+        for backend in backends:
+            detector = TrendDetector(method, backend)
+            cases.append(('trend3D[{}-{}]_{}'.format(method, backend, tag), lambda d=detector: d.trend3D(arr), NPixel))
+
+    # daily noleap series from 2000-01-01, with a Feb 29 when long enough
+    times = pd.date_range('2000-01-01', periods=NTime, freq='D')
+    noLeap = arr[:NTime - int(((times.month == 2) & (times.day == 29)).sum())]
+    cases.append(('fill_values_in_Feb29_' + tag,
+                  lambda: fill_values_in_Feb29(noLeap, times[0], times[-1]), NPixel))
+
+    cases.append(('RemoveSeaAsNan_' + tag, coldLandMask(lambda: RemoveSeaAsNan(arr, lat, lon)), NPixel))
+    return cases
+
+
+def gitCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmarks(grids=(1.0,), steps=(30, 365), methods=('linear',), backends=('numpy', 'numba'), repeat=3):
+    """
+    Run all cases, return the JSON-able report.
+    """
+    if not numbaAvailable():
+        backends = [b for b in backends if b != 'numba']
+    # masks are computed in memory, not read from a disk cache set by HYDRO_LANDMASK_CACHE
+    LandMask.SetLandMaskCacheDir(None)
+    results = {}
+
+    def record(name, func, NPixel):
+        seconds, median, peak = measure(func, repeat)
+        results[name] = {'seconds': seconds, 'medianSeconds': median, 'peakBytes': peak,
+                         'pixelsPerSecond': NPixel / seconds}
+        print('{:<45s} {:10.4f} s {:10.1f} MB {:14.0f} pixel/s'.format(name, seconds, peak / 2**20, NPixel / seconds))
+
+    for resolution in grids:
+        lat, lon, _ = syntheticGrid(resolution, 1)
+        record('FromLatLonGetLandOrSea_{}deg'.format(resolution),
+               coldLandMask(lambda: FromLatLonGetLandOrSea(lat, lon)), len(lat) * len(lon))
+        record('FromLatLonGetLandOrSea[cached]_{}deg'.format(resolution),
+               lambda: FromLatLonGetLandOrSea(lat, lon), len(lat) * len(lon))
+        for NTime in steps:
+            for name, func, NPixel in buildCases(resolution, NTime, methods, backends):
+                record(name, func, NPixel)
+            gc.collect()
+
+    return {'meta': {'commit': gitCommit(), 'date': pd.Timestamp.now().isoformat(),
+                     'python': platform.python_version(), 'numpy': np.__version__,
+                     'machine': platform.machine(), 'cpuCount': os.cpu_count(), 'repeat': repeat},
+            'results': results}
+
+
+def compareReports(new, old, threshold=0.2, minSeconds=0.01):
+    """
+    Cases of both reports whose median time grew by more than threshold (relative) and by more than
+    minSeconds (absolute noise floor of short cases), as {name: (old seconds, new seconds)}.
+    Reports without medians are compared on the best time.
+    """
+    regressions = {}
+    for name, res in new['results'].items():
+        if name not in old['results']:
+            continue
+        key = 'medianSeconds' if 'medianSeconds' in res and 'medianSeconds' in old['results'][name] else 'seconds'
+        before, after = old['results'][name][key], res[key]
+        if after > before * (1 + threshold) and after - before > minSeconds:
+            regressions[name] = (before, after)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grids', default='1', help='comma-separated resolutions in degree, e.g. 1,0.25,0.1')
+    parser.add_argument('--steps', default='30,365', help='comma-separated numbers of time steps')
+    parser.add_argument('--methods', default='linear', help='trend methods, e.g. linear,sen')
+    parser.add_argument('--backends', default='numpy,numba', help='trend backends')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', default=os.path.join(tempfile.gettempdir(), 'bench_output.json'),
+                        help='JSON file of the results, in the temp directory by default')
+    parser.add_argument('--compare', default=None, help='JSON file of previous results')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown flagged as regression')
+    parser.add_argument('--min-seconds', type=float, default=0.01, help='slowdowns below it (s) are noise')
+    args = parser.parse_args()
+
+    report = runBenchmarks(grids=[float(g) for g in args.grids.split(',')],
+                           steps=[int(s) for s in args.steps.split(',')],
+                           methods=args.methods.split(','), backends=args.backends.split(','),
+                           repeat=args.repeat)
+    with open(args.out, "w", encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print('Results saved to {}'.format(args.out))
+
+    if args.compare is not None:
+        with open(args.compare, encoding='utf-8') as f:
+            old = json.load(f)
+        regressions = compareReports(report, old, args.threshold, args.min_seconds)
+        for name, (before, after) in regressions.items():
+            print('REGRESSION {}: {:.4f} s -> {:.4f} s ({:+.0%})'.format(name, before, after, after / before - 1))
+        if regressions:
+            sys.exit(1)
+        print('No regression beyond {:.0%} against {}'.format(args.threshold, args.compare))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,9 @@ import numpy as np
 import gdal 
 from osgeo import osr
 
+from HYDRO_Log import timed
+
+@timed('HYDRO_Format.From2DNumpyArrayToTiff')
 def From2DNumpyArrayToTiff(data, lat, lon, tiff_path):
     assert len(data.shape) == 2, "Shape of data must be 2D."
     xsize = len(lon)
@@ -31,6 +34,7 @@ def From2DNumpyArrayToTiff(data, lat, lon, tiff_path):
     dst_ds.GetRasterBand(1).WriteArray(data)
     dst_ds = None
 
+@timed('HYDRO_Format.FromTiffToNumpyArray')
 def FromTiffToNumpyArray(tiff_path, return_lat_lon=False):
     ds = gdal.Open(tiff_path)
     data = ds.GetRasterBand(1).ReadAsArray()
@@ -0,0 +1,88 @@
+import numpy as np
+
+from HYDRO_Generator.GlobalGridInfo import DEFAULT_MEMORY_BUDGET, FromLatLonGetCellAreas
+
+COARSEN_STATS = ['mean', 'sum', 'max', 'validFraction']
+
+
+def CoarsenCoords(coords, factor):
+    """
+    Given list of cell centers, return the centers of the blocks of factor cells.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    assert len(coords) % factor == 0, "Length of coords [{}] is not a multiple of {}.".format(len(coords), factor)
+    return coords.reshape(-1, factor).mean(axis=1)
+
+
+def _blockWeightedSum(values, weights):
+    """
+    Sum of values (time, lat, fLat, lon, fLon) * weights over the block axes, without a weighted copy of values.
+    """
+    if weights.shape[3] == 1:
+        # weights of regular longitudes only vary along the rows of a block
+        return (values.sum(axis=4, dtype=np.float64) * weights[..., 0]).sum(axis=2)
+    return np.einsum('tafbc,afbc->tab', values, weights, dtype=np.float64, casting='unsafe')
+
+
+def CoarsenBlocks(arr, latlst, lonlst, factor, stats=('mean',), minValid=0.0, memoryBudget=DEFAULT_MEMORY_BUDGET):
+    """
+    Area-weighted coarsening (upscaling) of a 2D/3D (time, lat, lon) array by blocks of factor x factor cells,
+    e.g. 0.05° to 0.5° with factor 10. Every block of time steps is reshaped to (time, lat, fLat, lon, fLon)
+    and reduced over the block axes, the time axis is read in blocks (np.memmap and lazy arrays are not loaded as a whole).
+
+    Args:
+        arr (_type_): 2D (lat, lon) or 3D (time, lat, lon) array, nan for invalid cells.
+        latlst (_type_): cell-center latitudes.
+        lonlst (_type_): cell-center longitudes.
+        factor (int or tuple): cells per block, or (lat, lon) cells per block; must divide the grid.
+        stats (tuple, optional): outputs among 'mean' (area-weighted over the valid cells), 'sum' (of the valid cells),
+            'max' and 'validFraction' (valid area / block area). Defaults to ('mean',).
+        minValid (float, optional): mean, sum and max are nan where the valid fraction is below it. Defaults to 0.0.
+        memoryBudget (int, optional): bytes of one block of time steps. Defaults to 512 MB.
+
+    Returns:
+        tuple: (dict of stat -> coarse array, lat, lon), arrays are (time, lat, lon) or (lat, lon) for 2D input.
+    """
+    for stat in stats:
+        assert stat in COARSEN_STATS, "stat must be one of {}, but given {}".format(COARSEN_STATS, stat)
+    assert len(arr.shape) in [2, 3], "Shape of data must be 2 or 3."
+    NLat, NLon = arr.shape[-2:]
+    assert NLat == len(latlst) and NLon == len(lonlst), "Shape of data does not match lat, lon."
+    fLat, fLon = (factor, factor) if np.isscalar(factor) else factor
+    newLat, newLon = CoarsenCoords(latlst, fLat), CoarsenCoords(lonlst, fLon)
+    MLat, MLon = len(newLat), len(newLon)
+
+    areas = FromLatLonGetCellAreas(latlst, lonlst)
+    # (lat, fLat, 1, 1) for regular longitudes, (lat, fLat, lon, fLon) otherwise
+    weights = areas.reshape(MLat, fLat, 1, 1) if areas.shape[1] == 1 else areas.reshape(MLat, fLat, MLon, fLon)
+    blockArea = np.broadcast_to(weights, (MLat, fLat, MLon, fLon)).sum(axis=(1, 3))
+
+    is2D = len(arr.shape) == 2
+    NTime = 1 if is2D else arr.shape[0]
+    dtype = np.result_type(arr.dtype, np.float32)
+    results = {stat: np.empty((NTime, MLat, MLon), dtype=dtype) for stat in stats}
+    step = max(1, memoryBudget // (NLat * NLon * 8 * 3))
+    for start in range(0, NTime, step):
+        stop = min(start + step, NTime)
+        block = np.asarray(arr if is2D else arr[start:stop]).reshape(stop - start, MLat, fLat, MLon, fLon)
+        isFinite = np.isfinite(block)
+        fraction = _blockWeightedSum(isFinite, weights) / blockArea
+        isEnough = (fraction > 0) & (fraction >= minValid)
+        if 'mean' in stats or 'sum' in stats:
+            filled = np.where(isFinite, block, 0)
+        if 'mean' in stats:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = _blockWeightedSum(filled, weights) / (fraction * blockArea)
+            results['mean'][start:stop] = np.where(isEnough, mean, np.nan)
+        if 'sum' in stats:
+            results['sum'][start:stop] = np.where(isEnough, filled.sum(axis=(2, 4), dtype=np.float64), np.nan)
+        if 'max' in stats:
+            # fmax skips nan, all-nan blocks stay nan
+            blockMax = np.fmax.reduce(np.fmax.reduce(block, axis=4), axis=2)
+            results['max'][start:stop] = np.where(isEnough, blockMax, np.nan)
+        if 'validFraction' in stats:
+            results['validFraction'][start:stop] = fraction
+
+    if is2D:
+        results = {stat: res[0] for stat, res in results.items()}
+    return results, newLat, newLon
@@ -1,7 +1,103 @@
 import numpy as np
 import xarray as xr
 
-def GetDatasetElement(ds):
-    #TODO: 方便直接从dataset获得 data, time, lat, lon
-    
-    return 
\ No newline at end of file
+__all__ = ['GetDatasetElement', 'FindCoordName']
+
+COORD_NAMES = {
+    'lat' : ['lat', 'latitude', 'y', 'nav_lat', 'rlat'],
+    'lon' : ['lon', 'longitude', 'x', 'nav_lon', 'rlon'],
+    'time': ['time', 't', 'date', 'valid_time'],
+}
+COORD_UNITS = {
+    'lat': ['degrees_north', 'degree_north', 'degree_n', 'degrees_n'],
+    'lon': ['degrees_east', 'degree_east', 'degree_e', 'degrees_e'],
+}
+
+def FindCoordName(obj, kind):
+    """
+    Name of the lat, lon or time dim of a dataset or data array, from the usual names (case insensitive),
+    then from the standard_name / units attributes. None if not found.
+    """
+    assert kind in COORD_NAMES
+    names = {name.lower(): name for name in obj.dims}
+    for candidate in COORD_NAMES[kind]:
+        if candidate in names:
+            return names[candidate]
+    for name in obj.dims:
+        if name not in obj.coords:
+            continue
+        attrs = obj[name].attrs
+        if attrs.get('standard_name', '').lower() in [kind, {'lat': 'latitude', 'lon': 'longitude', 'time': 'time'}[kind]]:
+            return name
+        if attrs.get('units', '').lower() in COORD_UNITS.get(kind, []):
+            return name
+        if kind == 'time' and np.issubdtype(obj[name].dtype, np.datetime64):
+            return name
+    return None
+
+def GetDatasetElement(ds, variable=None, latRange=None, lonRange=None, timeRange=None, descendingLat=True, asArray=False):
+    """
+    方便直接从dataset获得 data, time, lat, lon
+    Get data, time, lat, lon of a variable without loading it: the data stays a lazy (or dask) DataArray,
+    subsetting and reordering are indexing views, only the coords are read.
+
+    Args:
+        ds (_type_): xarray.Dataset or DataArray, e.g. from xr.open_dataset.
+        variable (str, optional): name of the variable. Defaults to the data variable with the most dims.
+        latRange (tuple, optional): (south, north) box. Defaults to None.
+        lonRange (tuple, optional): (west, east) box in -180-180 or 0-360 degrees, whatever the grid uses;
+            west > east crosses the seam, a span of 360 or more is the whole globe. Defaults to None.
+        timeRange (tuple, optional): (start, end) included, anything accepted by DataArray.sel. Defaults to None.
+        descendingLat (bool, optional): reverse an ascending latitude (a view), as needed by the map plots. Defaults to True.
+        asArray (bool, optional): return the underlying array (dask array, or numpy view of in-memory data)
+            instead of the DataArray; lazily opened file data is loaded then. Defaults to False.
+
+    Returns:
+        tuple: (data, time, lat, lon), data is (time, lat, lon) or (lat, lon), time is None without time dim.
+    """
+    if isinstance(ds, xr.Dataset):
+        if variable is None:
+            variable = max(ds.data_vars, key=lambda name: len(ds[name].dims))
+        da = ds[variable]
+    else:
+        da = ds
+    latDim, lonDim, timeDim = FindCoordName(da, 'lat'), FindCoordName(da, 'lon'), FindCoordName(da, 'time')
+    assert latDim is not None and lonDim is not None, "Can not find lat/lon dims in {}.".format(da.dims)
+
+    order = [dim for dim in [timeDim, latDim, lonDim] if dim is not None]
+    da = da.transpose(*order, ...)
+
+    lat = da[latDim].values
+    if descendingLat and len(lat) > 1 and lat[0] < lat[-1]:
+        da = da.isel({latDim: slice(None, None, -1)})
+        lat = lat[::-1]
+    if latRange is not None:
+        south, north = min(latRange), max(latRange)
+        da = da.sel({latDim: slice(north, south) if lat[0] > lat[-1] else slice(south, north)})
+
+    if lonRange is not None:
+        lon = da[lonDim].values
+        west, east = lonRange
+        # bounds in the convention of the grid, [0, 360) or [-180, 180)
+        base = 0 if lon.max() > 180 else -180
+        isGlobe = east - west >= 360
+        west, east = (west - base) % 360 + base, (east - base) % 360 + base
+        if isGlobe:
+            index = np.arange(len(lon))
+        elif west <= east:
+            index = np.flatnonzero((lon >= west) & (lon <= east))
+        else:
+            index = np.concatenate([np.flatnonzero(lon >= west), np.flatnonzero(lon <= east)])
+        assert len(index), "No longitude in {}.".format(lonRange)
+        if index[-1] - index[0] + 1 == len(index) and np.all(np.diff(index) == 1):
+            # contiguous: a slice keeps the data a view
+            index = slice(index[0], index[-1] + 1)
+        da = da.isel({lonDim: index})
+
+    if timeRange is not None:
+        assert timeDim is not None, "No time dim in {}.".format(da.dims)
+        da = da.sel({timeDim: slice(*timeRange)})
+
+    time = None if timeDim is None else da[timeDim].values
+    data = da.data if asArray else da
+    return data, time, da[latDim].values, da[lonDim].values
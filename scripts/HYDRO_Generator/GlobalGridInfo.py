@@ -1,28 +1,129 @@
+from functools import lru_cache
+
 import numpy as np
-from global_land_mask import globe
+
+from HYDRO_Generator import LandMask
+
+# bytes of one block of time steps, the default of the blocked grid functions of HYDRO_Generator
+DEFAULT_MEMORY_BUDGET = 512 * 2**20
+
+
+def FromLatLonGetAreaMat(latlst, lonlst, resolution=None):
+    """
+    Given list of lat, lon, return the area matrix (m2) of the cells.
+    Exact spherical areas from the cell bounds, see FromLatLonGetCellAreas for a cached broadcastable view
+    and for resolution (cell size of single-row or single-column grids).
+    """
+    return np.array(np.broadcast_to(FromLatLonGetCellAreas(latlst, lonlst, resolution=resolution),
+                                    (len(latlst), len(lonlst))))
+
+
+def CellBounds(coords, isLat=False, resolution=None):
+    """
+    Given list of cell centers, return the len+1 bounds: midpoints between centers, the two outer
+    bounds half a spacing away from the outer centers (clipped to [-90, 90] for latitude).
+    A single center has no spacing, its cell is resolution wide (degree, default 1).
+    """
+    coords = np.atleast_1d(np.asarray(coords, dtype=np.float64))
+    assert coords.ndim == 1 and len(coords) >= 1, "Need 1D coords to derive the bounds."
+    if len(coords) == 1:
+        half = (1.0 if resolution is None else abs(resolution)) / 2
+        bounds = np.array([coords[0] - half, coords[0] + half])
+        return np.clip(bounds, -90, 90) if isLat else bounds
+    bounds = np.empty(len(coords) + 1)
+    bounds[1:-1] = (coords[1:] + coords[:-1]) / 2
+    bounds[0] = coords[0] - (coords[1] - coords[0]) / 2
+    bounds[-1] = coords[-1] + (coords[-1] - coords[-2]) / 2
+    if isLat:
+        bounds = np.clip(bounds, -90, 90)
+    return bounds
 
 
-def FromLatLonGetAreaMat(latlst, lonlst):
+@lru_cache(maxsize=64)
+def _cellAreas(latBytes, lonBytes, R, latResolution, lonResolution):
+    latlst = np.frombuffer(latBytes)
+    lonlst = np.frombuffer(lonBytes)
+    latBand = np.abs(np.diff(np.sin(np.deg2rad(CellBounds(latlst, isLat=True, resolution=latResolution)))))
+    lonWidth = np.abs(np.diff(np.deg2rad(CellBounds(lonlst, resolution=lonResolution))))
+    if np.allclose(lonWidth, lonWidth[0]):
+        areas = (R**2 * lonWidth[0] * latBand)[:, np.newaxis]
+    else:
+        areas = R**2 * np.outer(latBand, lonWidth)
+    areas.setflags(write=False)
+    return areas
+
+
+def FromLatLonGetCellAreas(latlst, lonlst, R=6371.4e3, resolution=None):
     """
-    Given list of lat, lon, return the area matrix.
+    Given list of lat, lon (cell centers of any resolution), return the exact spherical area (m2)
+    of every cell, R^2 * |sin(lat1) - sin(lat2)| * |lon2 - lon1|.
+    Results are memoized per grid and read-only: a (lat, 1) array broadcasting against (..., lat, lon)
+    data for regular longitudes, a (lat, lon) array otherwise.
+    resolution (degree, or (lat, lon) degrees) is the cell size of a grid with a single row or column,
+    whose spacing can not be derived from the centers; default 1.
+    """
+    latlst = np.ascontiguousarray(np.atleast_1d(latlst), dtype=np.float64)
+    lonlst = np.ascontiguousarray(np.atleast_1d(lonlst), dtype=np.float64)
+    latResolution, lonResolution = (resolution, resolution) if resolution is None or np.isscalar(resolution) else resolution
+    return _cellAreas(latlst.tobytes(), lonlst.tobytes(), float(R),
+                      None if latResolution is None else float(latResolution),
+                      None if lonResolution is None else float(lonResolution))
+
+
+def AreaWeightedMean(arr, latlst, lonlst, mask=None, memoryBudget=DEFAULT_MEMORY_BUDGET):
     """
-    R = 6371.4e3
-    lat_j_rad = np.deg2rad(latlst)
-    cos_j = np.cos(lat_j_rad)
-    Sj = 2 * np.pi**2 * cos_j * R**2 / (180 * 360)
-    Sij = np.repeat(Sj.reshape(-1, 1), len(lonlst), axis=1)
-    return Sij
+    Area-weighted mean of a 2D/3D (time, lat, lon) array over the globe or regions, nan cells are skipped.
+    The time axis is read in blocks (np.memmap and lazy arrays are not loaded as a whole),
+    and every block is reduced by one matrix product with the weights of all regions,
+    so no weighted copy of the data is made.
+
+    Args:
+        arr (_type_): 2D (lat, lon) or 3D (time, lat, lon) array.
+        latlst (_type_): cell-center latitudes.
+        lonlst (_type_): cell-center longitudes.
+        mask (_type_, optional): (lat, lon) bool of a region, or (region, lat, lon) bool of several regions. Defaults to None (globe).
+        memoryBudget (int, optional): bytes of one block of time steps. Defaults to 512 MB.
+
+    Returns:
+        np.ndarray: (time,) or (time, region) means, without the time axis for 2D input; nan where no valid cell.
+    """
+    assert len(arr.shape) in [2, 3], "Shape of data must be 2 or 3."
+    NLat, NLon = arr.shape[-2:]
+    assert NLat == len(latlst) and NLon == len(lonlst), "Shape of data does not match lat, lon."
+    weights = np.broadcast_to(FromLatLonGetCellAreas(latlst, lonlst), (NLat, NLon)).reshape(1, -1)
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        weights = (mask.reshape(-1, NLat * NLon) * weights)
+    # (pixel, region)
+    weights = np.ascontiguousarray(weights.T)
+
+    is2D = len(arr.shape) == 2
+    NTime = 1 if is2D else arr.shape[0]
+    out = np.empty((NTime, weights.shape[1]))
+    step = max(1, memoryBudget // (NLat * NLon * 8 * 3))
+    for start in range(0, NTime, step):
+        stop = min(start + step, NTime)
+        block = np.asarray(arr if is2D else arr[start:stop], dtype=np.float64).reshape(stop - start, -1)
+        isFinite = np.isfinite(block)
+        total = np.where(isFinite, block, 0) @ weights
+        area = isFinite @ weights
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[start:stop] = np.where(area > 0, total / area, np.nan)
+
+    if mask is None or mask.ndim == 2:
+        out = out[:, 0]
+    return out[0] if is2D else out
 
 
 def FromLatLonGetLandOrSea(latlst, lonlst, boolType=True):
     """
     Given list of lat, lon, return the land or sea matrix .
     If boolType is True, return bool matrix, else return 1 for land and nan for sea (easy for multiply).
+    The land mask of a grid is computed once and cached, see HYDRO_Generator.LandMask.
     """
-    lat_mesh, lon_mesh = np.meshgrid(latlst, lonlst)
-    land_mask = globe.is_land(lat_mesh, lon_mesh).T
+    land_mask = LandMask.defaultLandMaskCache.get(latlst, lonlst)
     if boolType:
-        return land_mask
+        return land_mask.copy()
     else:
         return np.where(land_mask, 1, np.nan)
 
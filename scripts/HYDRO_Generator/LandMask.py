@@ -0,0 +1,109 @@
+import os
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from global_land_mask import globe
+
+
+def LandMaskFromIndex(latIndex, lonIndex):
+    """
+    Given row and column indices of the global 1 km mask, return the (lat, lon) land bool matrix.
+    The rows and columns are picked separably, without a meshgrid of the coordinates.
+    """
+    return ~globe._mask[np.ix_(np.asarray(latIndex), np.asarray(lonIndex))]
+
+
+def LandMaskSeparable(latlst, lonlst):
+    """
+    Given list of lat, lon, return the land bool matrix, same as globe.is_land on the meshgrid.
+    """
+    return LandMaskFromIndex(globe.lat_to_index(latlst), globe.lon_to_index(lonlst))
+
+
+class LandMaskCache:
+    def __init__(self, cacheDir=None, maxEntries=16) -> None:
+        """
+        Land masks keyed by the grid definition (the lat and lon coords).
+        Masks are memoized in memory (the maxEntries most recently used ones), and if cacheDir is given
+        stored on disk bit-packed row by row (1 bit per cell) and opened by memory map.
+
+        Args:
+            cacheDir (str, optional): directory of the packed masks. Defaults to None (memory only).
+            maxEntries (int, optional): number of masks kept in memory. Defaults to 16.
+        """
+        self.cacheDir = cacheDir
+        self.maxEntries = maxEntries
+        self._memo = OrderedDict()
+        if cacheDir is not None:
+            os.makedirs(cacheDir, exist_ok=True)
+
+    @staticmethod
+    def key(latlst, lonlst):
+        h = hashlib.blake2b(digest_size=16)
+        for coords in [latlst, lonlst]:
+            coords = np.ascontiguousarray(coords, dtype=np.float64)
+            h.update(str(coords.shape).encode())
+            h.update(memoryview(coords.view(np.uint8)))
+        return h.hexdigest()
+
+    def _entryPath(self, key):
+        return os.path.join(self.cacheDir, key + '.npy')
+
+    def packed(self, latlst, lonlst):
+        """
+        The (lat, ceil(lon / 8)) uint8 packed mask of the disk store as a read-only memory map,
+        computed and written first if needed. Needs cacheDir.
+        """
+        assert self.cacheDir is not None, "The cache has no directory."
+        path = self._entryPath(self.key(latlst, lonlst))
+        if not os.path.isfile(path):
+            tmpPath = path + '.tmp.npy'
+            np.save(tmpPath, np.packbits(LandMaskSeparable(latlst, lonlst), axis=1))
+            os.replace(tmpPath, path)
+        return np.load(path, mmap_mode='r')
+
+    def rows(self, latlst, lonlst, start, stop):
+        """
+        Land bool rows [start, stop) of the grid, only these rows of the disk store are read and unpacked.
+        """
+        return np.unpackbits(self.packed(latlst, lonlst)[start:stop], axis=1, count=len(lonlst)).astype(bool)
+
+    def get(self, latlst, lonlst):
+        """
+        Read-only (lat, lon) land bool matrix of the grid.
+        """
+        key = self.key(latlst, lonlst)
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            return self._memo[key]
+
+        if self.cacheDir is None:
+            landMask = LandMaskSeparable(latlst, lonlst)
+        else:
+            landMask = np.unpackbits(self.packed(latlst, lonlst), axis=1, count=len(lonlst)).astype(bool)
+        landMask.setflags(write=False)
+        self._memo[key] = landMask
+        while len(self._memo) > self.maxEntries:
+            self._memo.popitem(last=False)
+        return landMask
+
+    def clear(self, disk=False):
+        self._memo.clear()
+        if disk and self.cacheDir is not None:
+            for f in os.listdir(self.cacheDir):
+                if f.endswith('.npy'):
+                    os.remove(os.path.join(self.cacheDir, f))
+
+
+# shared by FromLatLonGetLandOrSea and the masking functions, on disk if HYDRO_LANDMASK_CACHE is set
+defaultLandMaskCache = LandMaskCache(os.environ.get('HYDRO_LANDMASK_CACHE'))
+
+
+def SetLandMaskCacheDir(cacheDir=None, maxEntries=16):
+    """
+    Replace the default cache, e.g. to store the masks of large grids on disk.
+    """
+    global defaultLandMaskCache
+    defaultLandMaskCache = LandMaskCache(cacheDir, maxEntries)
+    return defaultLandMaskCache
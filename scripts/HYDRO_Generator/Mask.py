@@ -1,11 +1,75 @@
+import sys
+
 import numpy as np
-from HYDRO_Generator.GlobalGridInfo import FromLatLonGetLandOrSea
+from HYDRO_Generator import LandMask
+from HYDRO_Generator.GlobalGridInfo import DEFAULT_MEMORY_BUDGET, FromLatLonGetLandOrSea
+from HYDRO_Generator.PixelIndex import PixelIndex
+from HYDRO_Log import currentSpan, timed
+
+def MaskCells(arr, keep, fill=None, inplace=False, lazy=False, memoryBudget=DEFAULT_MEMORY_BUDGET):
+    """
+    Set the cells of a 2D/3D array where keep (lat, lon) is False to fill, keeping the dtype.
+
+    Args:
+        arr (_type_): 2D (lat, lon) or 3D (time, lat, lon) numpy array, np.memmap or xarray.DataArray.
+        keep (_type_): (lat, lon) bool, True for the cells to keep.
+        fill (_type_, optional): value of the removed cells. Defaults to nan (needed for integer data).
+        inplace (bool, optional): write into arr (a DataArray backed by numpy) block by block of time steps
+            and return it, without allocating another cube. Defaults to False (masked copy).
+        lazy (bool, optional): return a view instead: a numpy masked array sharing the data of arr with
+            a broadcast (read-only) mask, or DataArray.where (lazy for dask). Defaults to False.
+        memoryBudget (int, optional): bytes of one block of time steps. Defaults to 512 MB.
+    """
+    assert len(arr.shape) in [2, 3], "Shape of data must be 2 or 3."
+    # arr can only be a DataArray if xarray has been imported
+    xr = sys.modules.get('xarray')
+    isDataArray = xr is not None and isinstance(arr, xr.DataArray)
+    keep = np.asarray(keep, dtype=bool)
+    assert keep.shape == arr.shape[-2:], "Shape of mask {} does not match the data {}.".format(keep.shape, arr.shape)
+    assert not (inplace and lazy), "Choose inplace or lazy."
+
+    if lazy:
+        if isDataArray:
+            assert fill is not None or np.issubdtype(arr.dtype, np.inexact), \
+                "fill is needed for data of dtype {}.".format(arr.dtype)
+            keepDa = xr.DataArray(keep, dims=arr.dims[-2:], coords={d: arr[d] for d in arr.dims[-2:] if d in arr.coords})
+            return arr.where(keepDa) if fill is None else arr.where(keepDa, fill)
+        arr = np.asanyarray(arr)
+        masked = np.ma.masked_array(arr, mask=np.broadcast_to(~keep, arr.shape), copy=False)
+        if fill is not None:
+            masked.fill_value = fill
+        return masked
+
+    data = arr.data if isDataArray else arr
+    assert isinstance(data, np.ndarray), "Only numpy-backed data can be masked in place, use lazy for dask."
+    if fill is None:
+        assert np.issubdtype(data.dtype, np.inexact), "fill is needed for data of dtype {}.".format(data.dtype)
+        fill = np.nan
+    if not inplace:
+        data = data.copy()
+    remove = ~keep
+    if len(data.shape) == 2:
+        data[remove] = fill
+    else:
+        # the (lat, lon) cells to remove, in blocks of time steps
+        step = max(1, int(memoryBudget // max(1, data[0].nbytes)))
+        for start in range(0, data.shape[0], step):
+            data[start:start + step, remove] = fill
+    if isDataArray:
+        return arr if inplace else arr.copy(data=data)
+    return data
 
-def RemoveSeaAsNan(arr, latlst, lonlst):
+@timed('HYDRO_Generator.RemoveSeaAsNan')
+def RemoveSeaAsNan(arr, latlst, lonlst, inplace=False, lazy=False, fill=None):
     """
     Given a 2D/3D array, remove the sea area as nan.
+    By default the array is multiplied by a 1/nan land mask (float64 result);
+    with inplace, lazy or fill, the dtype is kept and the sea cells are set to fill, see MaskCells.
     """
     assert len(arr.shape) in [2, 3], "Shape of data must be 2 or 3."
+    currentSpan().add(int(np.prod(arr.shape)))
+    if inplace or lazy or fill is not None:
+        return MaskCells(arr, LandMask.defaultLandMaskCache.get(latlst, lonlst), fill, inplace, lazy)
     landMask = FromLatLonGetLandOrSea(latlst, lonlst, boolType=False)
     if len(arr.shape)==2:
         arr = arr * landMask
@@ -14,11 +78,17 @@ def RemoveSeaAsNan(arr, latlst, lonlst):
     
     return arr
     
-def RemoveLandAsNan(arr, latlst, lonlst):
+@timed('HYDRO_Generator.RemoveLandAsNan')
+def RemoveLandAsNan(arr, latlst, lonlst, inplace=False, lazy=False, fill=None):
     """
     Given a 2D/3D array, remove the land area as nan.
+    By default the array is multiplied by a 1/nan sea mask (float64 result);
+    with inplace, lazy or fill, the dtype is kept and the land cells are set to fill, see MaskCells.
     """
     assert len(arr.shape) in [2, 3], "Shape of data must be 2 or 3."
+    currentSpan().add(int(np.prod(arr.shape)))
+    if inplace or lazy or fill is not None:
+        return MaskCells(arr, ~LandMask.defaultLandMaskCache.get(latlst, lonlst), fill, inplace, lazy)
     seaMask = FromLatLonGetLandOrSea(latlst, lonlst, boolType=False)
     seaMask = np.where(seaMask==1, np.nan, 1)
     
@@ -28,6 +98,21 @@ def RemoveLandAsNan(arr, latlst, lonlst):
         arr = arr * seaMask[np.newaxis, :, :]
     
     return arr
-        
-    
-    
\ No newline at end of file
+
+def GetLandPixels(arr, latlst, lonlst):
+    """
+    Given a 2D/3D array, return the values of land cells as a dense (..., nLand) array
+    and the PixelIndex to scatter results back to the grid.
+    """
+    assert len(arr.shape) in [2, 3], "Shape of data must be 2 or 3."
+    pixelIndex = PixelIndex.fromLatLon(latlst, lonlst, land=True)
+    return pixelIndex.gather(arr), pixelIndex
+
+def GetSeaPixels(arr, latlst, lonlst):
+    """
+    Given a 2D/3D array, return the values of sea cells as a dense (..., nSea) array
+    and the PixelIndex to scatter results back to the grid.
+    """
+    assert len(arr.shape) in [2, 3], "Shape of data must be 2 or 3."
+    pixelIndex = PixelIndex.fromLatLon(latlst, lonlst, land=False)
+    return pixelIndex.gather(arr), pixelIndex
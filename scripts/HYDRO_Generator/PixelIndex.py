@@ -0,0 +1,63 @@
+import numpy as np
+from HYDRO_Generator.GlobalGridInfo import FromLatLonGetLandOrSea
+
+
+class PixelIndex:
+    def __init__(self, mask) -> None:
+        """
+        Compressed representation of the valid cells of a (lat, lon) grid.
+        Build it once, gather the time series of the valid cells into a dense (time, nValid) matrix,
+        compute on that matrix only, and scatter the results back to the grid.
+
+        Args:
+            mask (_type_): 2D bool array, True for valid cells.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        assert len(mask.shape)==2, "Shape of mask must be 2D."
+        self.mask = mask
+        self.shape = mask.shape
+        self.flatIndex = np.flatnonzero(mask)
+        self.nValid = len(self.flatIndex)
+
+    @classmethod
+    def fromLatLon(cls, latlst, lonlst, land=True):
+        """
+        Index of land cells (or sea cells if land is False).
+        """
+        landMask = FromLatLonGetLandOrSea(latlst, lonlst, boolType=True)
+        return cls(landMask if land else ~landMask)
+
+    @classmethod
+    def fromNanMask(cls, arr):
+        """
+        Index of the cells which are finite in a 2D array, or finite at least once along the time (0th) axis of a 3D array.
+        """
+        arr = np.asarray(arr)
+        assert len(arr.shape) in [2, 3], "Shape of data must be 2 or 3."
+        if len(arr.shape)==2:
+            return cls(np.isfinite(arr))
+        mask = np.zeros(arr.shape[1:], dtype=bool)
+        for arr2D in arr:
+            mask |= np.isfinite(arr2D)
+        return cls(mask)
+
+    def gather(self, arr):
+        """
+        From (..., lat, lon) to (..., nValid).
+        """
+        arr = np.asarray(arr)
+        assert arr.shape[-2:] == self.shape, \
+            "Shape of data {} does not match the grid {}.".format(arr.shape, self.shape)
+        return np.take(arr.reshape(arr.shape[:-2] + (-1,)), self.flatIndex, axis=-1)
+
+    def scatter(self, values, fill=np.nan, dtype=None):
+        """
+        From (..., nValid) to (..., lat, lon), the cells out of the index are fill.
+        """
+        values = np.asarray(values)
+        assert values.shape[-1] == self.nValid, \
+            "Length of values [{}] does not match the index [{}].".format(values.shape[-1], self.nValid)
+        dtype = values.dtype if dtype is None else dtype
+        out = np.full(values.shape[:-1] + (self.shape[0] * self.shape[1],), fill, dtype=dtype)
+        out[..., self.flatIndex] = values
+        return out.reshape(values.shape[:-1] + self.shape)
@@ -0,0 +1,201 @@
+import os
+import sys
+import hashlib
+
+import numpy as np
+
+from HYDRO_Generator.GlobalGridInfo import DEFAULT_MEMORY_BUDGET, CellBounds
+
+
+def _isPeriodic(lon):
+    """
+    True for regular longitudes covering the whole circle.
+    """
+    lon = np.sort(np.asarray(lon, dtype=np.float64))
+    if len(lon) < 2:
+        return False
+    step = np.diff(lon)
+    return np.allclose(step, step[0]) and abs(step[0] * len(lon) - 360) < 1e-6
+
+
+def _linearIndex(src, dst, periodic):
+    """
+    For every dst coord, the two src neighbours (indices of the ascending src) and the weight of the second one.
+    """
+    n = len(src)
+    if periodic:
+        dst = src[0] + (dst - src[0]) % 360
+        left = np.searchsorted(src, dst, side='right') - 1
+        right = (left + 1) % n
+        span = np.where(right == 0, src[0] + 360 - src[-1], src[right] - src[left])
+    else:
+        dst = np.clip(dst, src[0], src[-1])
+        left = np.clip(np.searchsorted(src, dst, side='right') - 1, 0, max(n - 2, 0))
+        right = np.minimum(left + 1, n - 1)
+        span = np.where(right == left, 1, src[right] - src[left])
+    weight = np.clip((dst - src[left]) / span, 0, 1)
+    return left, right, weight
+
+
+def _overlapIndex(srcBounds, dstBounds, periodic, transform):
+    """
+    Overlap of every pair of src and dst intervals (ascending bounds) measured after transform,
+    as (dst index, src index, fraction of the dst interval).
+    """
+    shifts = [-360.0, 0.0, 360.0] if periodic else [0.0]
+    dstAll = np.concatenate([dstBounds + s for s in shifts])
+    points = np.unique(np.concatenate([srcBounds, dstAll]))
+    points = points[(points >= srcBounds[0]) & (points <= srcBounds[-1])]
+    mid = (points[1:] + points[:-1]) / 2
+    length = transform(points[1:]) - transform(points[:-1])
+
+    nDst = len(dstBounds) - 1
+    srcIndex = np.searchsorted(srcBounds, mid) - 1
+    rows, cols, values = [], [], []
+    for s in shifts:
+        dstIndex = np.searchsorted(dstBounds + s, mid) - 1
+        inside = (dstIndex >= 0) & (dstIndex < nDst)
+        rows.append(dstIndex[inside])
+        cols.append(srcIndex[inside])
+        values.append(length[inside])
+    rows, cols, values = np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+    dstLength = transform(dstBounds[1:]) - transform(dstBounds[:-1])
+    return rows, cols, values / dstLength[rows]
+
+
+def AxisWeights(src, dst, method='bilinear', isLat=False):
+    """
+    Sparse (len(dst), len(src)) interpolation matrix along one axis of a regular grid.
+    'bilinear' and 'nearest' use the cell centers (longitudes wrap around for global grids),
+    'conservative' the overlap of the cells, measured by sin(lat) along latitude (area).
+    """
+    from scipy import sparse
+    assert method in ['bilinear', 'nearest', 'conservative']
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    # work on ascending coords, then map back to the original orders
+    srcOrder = np.argsort(src)
+    srcSorted = src[srcOrder]
+    periodic = not isLat and _isPeriodic(src)
+
+    if method == 'conservative':
+        transform = (lambda x: np.sin(np.deg2rad(x))) if isLat else (lambda x: x)
+        dstOrder = np.argsort(dst)
+        srcBounds = CellBounds(srcSorted, isLat)
+        dstBounds = CellBounds(dst[dstOrder], isLat)
+        rows, cols, values = _overlapIndex(srcBounds, dstBounds, periodic, transform)
+        rows = dstOrder[rows]
+    else:
+        left, right, weight = _linearIndex(srcSorted, dst, periodic)
+        rows = np.arange(len(dst))
+        if method == 'nearest':
+            cols = np.where(weight < 0.5, left, right)
+            values = np.ones(len(dst))
+        else:
+            rows = np.concatenate([rows, rows])
+            cols = np.concatenate([left, right])
+            values = np.concatenate([1 - weight, weight])
+    return sparse.csr_matrix((values, (rows, srcOrder[cols])), shape=(len(dst), len(src)))
+
+
+class Regridder:
+    def __init__(self, srcLat, srcLon, dstLat, dstLon, method='bilinear', cacheDir=None) -> None:
+        """
+        Regridding between two regular lat/lon grids with a precomputed sparse weight matrix.
+        The weights are separable, kron(latWeights, lonWeights), so they are built from 1D weights only,
+        and they can be cached on disk keyed by both grids and the method.
+
+        Args:
+            srcLat (_type_): cell-center latitudes of the source grid (ascending or descending).
+            srcLon (_type_): cell-center longitudes of the source grid.
+            dstLat (_type_): latitudes of the target grid, e.g. from LatCoords.
+            dstLon (_type_): longitudes of the target grid, e.g. from LonCoords.
+            method (str, optional): 'bilinear', 'nearest' or 'conservative' (first order). Defaults to 'bilinear'.
+            cacheDir (str, optional): directory of the weight files, e.g. shared by jobs on the same grids.
+                Defaults to None (no disk cache).
+        """
+        from scipy import sparse
+        assert method in ['bilinear', 'nearest', 'conservative']
+        self.srcLat, self.srcLon = np.asarray(srcLat, dtype=np.float64), np.asarray(srcLon, dtype=np.float64)
+        self.dstLat, self.dstLon = np.asarray(dstLat, dtype=np.float64), np.asarray(dstLon, dtype=np.float64)
+        self.method = method
+        self.srcShape = (len(self.srcLat), len(self.srcLon))
+        self.dstShape = (len(self.dstLat), len(self.dstLon))
+
+        h = hashlib.blake2b(digest_size=16)
+        for coords in [self.srcLat, self.srcLon, self.dstLat, self.dstLon]:
+            h.update(str(coords.shape).encode())
+            h.update(coords.tobytes())
+        h.update(method.encode())
+        self.key = h.hexdigest()
+
+        path = None if cacheDir is None else os.path.join(cacheDir, self.key + '.npz')
+        if path is not None and os.path.isfile(path):
+            self.weights = sparse.load_npz(path).tocsr()
+        else:
+            latWeights = AxisWeights(self.srcLat, self.dstLat, method, isLat=True)
+            lonWeights = AxisWeights(self.srcLon, self.dstLon, method)
+            self.weights = sparse.kron(latWeights, lonWeights, format='csr')
+            if path is not None:
+                os.makedirs(cacheDir, exist_ok=True)
+                tmpPath = path + '.tmp.npz'
+                sparse.save_npz(tmpPath, self.weights)
+                os.replace(tmpPath, path)
+
+    def _regridBlock(self, block):
+        """
+        (time, srcLat, srcLon) numpy block to (time, dstLat, dstLon), nan-aware: the weights of the
+        valid source cells are renormalised, target cells without any are nan.
+        """
+        NTime = block.shape[0]
+        flat = block.reshape(NTime, -1)
+        isFinite = np.isfinite(flat)
+        total = self.weights @ np.where(isFinite, flat, 0).T
+        weight = self.weights @ isFinite.T.astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out = np.where(weight > 1e-12, total / weight, np.nan)
+        dtype = block.dtype if np.issubdtype(block.dtype, np.floating) else np.float64
+        return out.T.reshape((NTime,) + self.dstShape).astype(dtype, copy=False)
+
+    def regrid(self, arr, memoryBudget=DEFAULT_MEMORY_BUDGET):
+        """
+        Regrid a 2D (lat, lon) or 3D (time, lat, lon) array: every block of time steps is one
+        sparse-dense matrix product.
+
+        Args:
+            arr (_type_): numpy array, np.memmap, dask array or xarray.DataArray (dims ending with lat, lon).
+            memoryBudget (int, optional): bytes of one block of time steps for numpy input. Defaults to 512 MB.
+
+        Returns:
+            _type_: same kind as arr (dask stays lazy, a DataArray gets the target coords), float dtype.
+        """
+        xr = sys.modules.get('xarray')
+        if xr is not None and isinstance(arr, xr.DataArray):
+            latDim, lonDim = arr.dims[-2:]
+            data = self.regrid(arr.data, memoryBudget)
+            coords = {k: v for k, v in arr.coords.items() if latDim not in v.dims and lonDim not in v.dims}
+            coords.update({latDim: self.dstLat, lonDim: self.dstLon})
+            return xr.DataArray(data, dims=arr.dims, coords=coords, attrs=arr.attrs, name=arr.name)
+
+        assert len(arr.shape) in [2, 3], "Shape of data must be 2 or 3."
+        assert tuple(arr.shape[-2:]) == self.srcShape, \
+            "Shape of data {} does not match the source grid {}.".format(arr.shape, self.srcShape)
+        if len(arr.shape) == 2:
+            return self.regrid(arr[np.newaxis], memoryBudget)[0]
+
+        if not isinstance(arr, np.ndarray):
+            # dask: one task per chunk of time steps, the grid is not split
+            arr = arr.rechunk({1: -1, 2: -1})
+            dtype = arr.dtype if np.issubdtype(arr.dtype, np.floating) else np.float64
+            return arr.map_blocks(self._regridBlock, chunks=(arr.chunks[0],) + self.dstShape, dtype=dtype)
+
+        NTime = arr.shape[0]
+        dtype = arr.dtype if np.issubdtype(arr.dtype, np.floating) else np.float64
+        out = np.empty((NTime,) + self.dstShape, dtype=dtype)
+        bytesPerStep = (self.srcShape[0] * self.srcShape[1] + self.dstShape[0] * self.dstShape[1]) * 8 * 3
+        step = max(1, memoryBudget // bytesPerStep)
+        for start in range(0, NTime, step):
+            out[start:start + step] = self._regridBlock(np.asarray(arr[start:start + step]))
+        return out
+
+    __call__ = regrid
@@ -0,0 +1,145 @@
+import sys
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def LatLonToXYZ(lat, lon):
+    """
+    Given lat, lon (degree), return the (n, 3) coordinates on the unit sphere.
+    """
+    lat = np.deg2rad(np.asarray(lat, dtype=np.float64)).ravel()
+    lon = np.deg2rad(np.asarray(lon, dtype=np.float64)).ravel()
+    cosLat = np.cos(lat)
+    return np.stack([cosLat * np.cos(lon), cosLat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def ChordToKm(chord):
+    """
+    Great-circle distance (km) of a chord of the unit sphere, equal to haversine.
+    """
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def KmToChord(km):
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=np.float64) / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+class SpatialIndex:
+    def __init__(self, lat, lon) -> None:
+        """
+        KD-tree over points (stations, grid cells...) on the unit sphere, for batched nearest,
+        k-nearest and radius queries of many points, with haversine distances in km.
+
+        Args:
+            lat (_type_): 1D latitudes of the points.
+            lon (_type_): 1D longitudes of the points.
+        """
+        from scipy.spatial import cKDTree
+        self.lat = np.asarray(lat, dtype=np.float64).ravel()
+        self.lon = np.asarray(lon, dtype=np.float64).ravel()
+        assert len(self.lat) == len(self.lon), "Length of lat and lon is not equal!"
+        self.tree = cKDTree(LatLonToXYZ(self.lat, self.lon))
+        self.gridShape = None
+        self.flatIndex = None
+
+    @classmethod
+    def fromGrid(cls, latlst, lonlst, mask=None):
+        """
+        Index of the cell centers of a (lat, lon) grid, only the cells where mask is True if given (e.g. land).
+        Query results are indices into these cells, gridIndex converts them to (row, col).
+        """
+        latlst, lonlst = np.asarray(latlst), np.asarray(lonlst)
+        flatIndex = np.arange(len(latlst) * len(lonlst)) if mask is None else np.flatnonzero(mask)
+        rows, cols = np.divmod(flatIndex, len(lonlst))
+        index = cls(latlst[rows], lonlst[cols])
+        index.gridShape = (len(latlst), len(lonlst))
+        index.flatIndex = flatIndex
+        return index
+
+    def gridIndex(self, index):
+        """
+        (row, col) in the grid of point indices returned by the queries.
+        """
+        assert self.gridShape is not None, "The index is not built from a grid."
+        return np.divmod(self.flatIndex[index], self.gridShape[1])
+
+    def nearest(self, lat, lon, maxKm=np.inf, nWorkers=1):
+        """
+        Nearest point of every query point.
+
+        Returns:
+            tuple: (index, km) 1D arrays, index is len(points) where no point is within maxKm.
+        """
+        chord, index = self.tree.query(LatLonToXYZ(lat, lon), k=1,
+                                       distance_upper_bound=KmToChord(maxKm) if np.isfinite(maxKm) else np.inf,
+                                       workers=nWorkers)
+        km = ChordToKm(np.where(np.isinf(chord), 0, chord))
+        km[np.isinf(chord)] = np.inf
+        return index, km
+
+    def kNearest(self, lat, lon, k, nWorkers=1):
+        """
+        The k nearest points of every query point, sorted by distance.
+
+        Returns:
+            tuple: (index, km) arrays of shape (n, k), index is len(points) and km is inf
+                after the last point when k is larger than the number of points.
+        """
+        chord, index = self.tree.query(LatLonToXYZ(lat, lon), k=k, workers=nWorkers)
+        chord, index = chord.reshape(-1, k), index.reshape(-1, k)
+        km = ChordToKm(np.where(np.isinf(chord), 0, chord))
+        km[np.isinf(chord)] = np.inf
+        return index, km
+
+    def withinRadius(self, lat, lon, radiusKm, nWorkers=1):
+        """
+        All points within radiusKm of every query point, sorted by distance.
+
+        Returns:
+            tuple: (index, km) lists with one 1D array per query point.
+        """
+        xyz = LatLonToXYZ(lat, lon)
+        found = self.tree.query_ball_point(xyz, KmToChord(radiusKm), workers=nWorkers)
+        indices, distances = [], []
+        for point, index in zip(xyz, found):
+            index = np.asarray(index, dtype=np.int64)
+            km = ChordToKm(np.linalg.norm(self.tree.data[index] - point, axis=1))
+            order = np.argsort(km)
+            indices.append(index[order])
+            distances.append(km[order])
+        return indices, distances
+
+    def extractSeries(self, arr, lat, lon, maxKm=np.inf):
+        """
+        Time series of the nearest grid cell of every station, gathered in one indexing operation.
+        The index must be built by fromGrid on the grid of arr.
+
+        Args:
+            arr (_type_): (time, lat, lon) numpy array, np.memmap or xarray.DataArray (lazy stays lazy).
+            lat (_type_): 1D station latitudes.
+            lon (_type_): 1D station longitudes.
+            maxKm (float, optional): stations farther from any cell get nan. Defaults to np.inf.
+
+        Returns:
+            tuple: (time, station) series (DataArray with a 'station' dim for DataArray input), and the km to the cells.
+        """
+        assert self.gridShape is not None, "The index is not built from a grid."
+        assert tuple(arr.shape[-2:]) == self.gridShape, \
+            "Shape of data {} does not match the grid {}.".format(arr.shape, self.gridShape)
+        index, km = self.nearest(lat, lon, maxKm)
+        isFound = index < len(self.lat)
+        rows, cols = self.gridIndex(np.where(isFound, index, 0))
+
+        xr = sys.modules.get('xarray')
+        if xr is not None and isinstance(arr, xr.DataArray):
+            _, latDim, lonDim = arr.dims
+            series = arr.isel({latDim: xr.DataArray(rows, dims='station'), lonDim: xr.DataArray(cols, dims='station')})
+            return (series if isFound.all() else series.where(xr.DataArray(isFound, dims='station'))), km
+
+        series = arr[:, rows, cols]
+        if not isFound.all():
+            series = series.astype(np.result_type(series.dtype, np.float32))
+            series[:, ~isFound] = np.nan
+        return series, km
@@ -5,22 +5,81 @@ def GenXarrayDS(data, name, time, lat, lon):
     """
     Given a 2D or 3D numpy array and its coordinate information, return the xarray dataset.
     """
-    
+
     assert len(data.shape) in [2, 3],\
         "Shape of data must be 2 or 3."
-        
+
     if len(data.shape)==2:
         assert data.shape == (len(lat), len(lon)),\
             "Shape for data, lat, lon are not matched."
-            
-        ds = xr.Dataset( data_vars={ name: (['lat', 'lon'], data) },
-                         coords={ 'lat': (['lat'], lat),  'lon': (['lon'], lon)} ) 
     elif len(data.shape)==3:
         assert data.shape == (len(time), len(lat), len(lon)),\
             "Shape for data, time, lat, lon are not matched."
-        ds = xr.Dataset(data_vars={ name: (['time', 'lat', 'lon'], data) },
-                        coords={'time': time,
-                                'lat': (['lat'], lat),
-                                'lon': (['lon'], lon)})
+    return GenXarrayMultiDS({name: data}, time if len(data.shape)==3 else None, lat, lon, encoding=False)
+
+def GenXarrayMultiDS(variables, time=None, lat=None, lon=None, chunks=None, encoding=True, attrs=None, checkNoCopy=False):
+    """
+    Given many 2D (lat, lon) or 3D (time, lat, lon) arrays, return one xarray dataset wrapping them without copy,
+    e.g. the six fields of TrendDetector.trend3D.
+
+    Args:
+        variables (dict): name -> numpy array (or dask array), or name -> (dims, array) for other dims.
+        time (_type_, optional): time coord of 3D arrays. Defaults to None.
+        lat (_type_, optional): lat coord. Defaults to None.
+        lon (_type_, optional): lon coord. Defaults to None.
+        chunks (dict, optional): dask chunks of the dims, e.g. {'time': 365}, the data stays in the same buffers. Defaults to None.
+        encoding (bool, optional): attach default NetCDF compression (zlib, level 4) and chunk sizes
+            to every variable, used by to_netcdf and WriteXarrayDS. Defaults to True.
+        attrs (dict, optional): global attributes. Defaults to None.
+        checkNoCopy (bool, optional): assert that the numpy inputs are shared by the dataset, xarray copies
+            e.g. masked arrays and non-native byte orders. Defaults to False.
+    """
+    dataVars = {}
+    for name, value in variables.items():
+        dims, data = value if isinstance(value, tuple) else (None, value)
+        if dims is None:
+            assert len(data.shape) in [2, 3], "Shape of {} must be 2 or 3, or give its dims.".format(name)
+            dims = ['lat', 'lon'] if len(data.shape) == 2 else ['time', 'lat', 'lon']
+        dataVars[name] = (dims, data)
+
+    coords = {}
+    for dim, coord in [('time', time), ('lat', lat), ('lon', lon)]:
+        if coord is not None:
+            coords[dim] = ([dim], np.asarray(coord)) if dim != 'time' else coord
+    ds = xr.Dataset(data_vars=dataVars, coords=coords, attrs=attrs)
+
+    for name, (_, data) in dataVars.items():
+        if checkNoCopy and isinstance(data, np.ndarray):
+            assert np.shares_memory(ds[name].values, data), "Data of {} has been copied.".format(name)
+    if chunks is not None:
+        ds = ds.chunk(chunks)
+
+    if encoding:
+        for name in ds.data_vars:
+            var = ds[name]
+            chunkSizes = tuple(c[0] for c in var.chunks) if var.chunks is not None \
+                else tuple(min(n, 256 if i >= len(var.shape) - 2 else 1) for i, n in enumerate(var.shape))
+            var.encoding.update({'zlib': True, 'complevel': 4, 'chunksizes': chunkSizes})
     return ds
-   
\ No newline at end of file
+
+def WriteXarrayDS(ds, path, compute=True):
+    """
+    Write a dataset to NetCDF (.nc) or Zarr (.zarr) in one streaming write: dask-backed
+    variables are written chunk by chunk, numpy-backed ones from their buffers.
+    The NetCDF encoding of GenXarrayMultiDS is translated to the chunks of the Zarr store
+    (Zarr compresses with its default compressor).
+
+    Args:
+        ds (xarray.Dataset): e.g. from GenXarrayMultiDS.
+        path (str): '*.nc' or '*.zarr'.
+        compute (bool, optional): False returns the dask delayed write. Defaults to True.
+    """
+    if path.rstrip('/').endswith('.zarr'):
+        encoding = {name: {'chunks': ds[name].encoding['chunksizes']} for name in ds.data_vars
+                    if 'chunksizes' in ds[name].encoding and ds[name].chunks is None}
+        ds = ds.copy()
+        for name in ds.data_vars:
+            # NetCDF-only keys are rejected by the Zarr backend
+            ds[name].encoding = {}
+        return ds.to_zarr(path, mode='w', encoding=encoding, compute=compute)
+    return ds.to_netcdf(path, compute=compute)
@@ -0,0 +1,134 @@
+import numpy as np
+
+from HYDRO_Generator.GlobalGridInfo import DEFAULT_MEMORY_BUDGET, FromLatLonGetCellAreas
+from HYDRO_Log import currentSpan, timed
+
+ZONAL_STATS = ['mean', 'sum', 'min', 'max', 'count']
+
+
+def RasterizePolygons(polygons, latlst, lonlst, fill=-1):
+    """
+    Given region polygons, return the (lat, lon) int label grid: the index of the polygon containing
+    every cell center, fill outside all polygons. A cell in several polygons gets the first one.
+    Only the cells in the bounding box of a polygon are tested (matplotlib.path).
+
+    Args:
+        polygons (list): one (n, 2) array of (lon, lat) vertices per region, or a list of them for
+            multi-part regions (holes are not supported). Longitudes in the convention of lonlst.
+        latlst (_type_): cell-center latitudes.
+        lonlst (_type_): cell-center longitudes.
+        fill (int, optional): label of the cells outside all polygons. Defaults to -1.
+    """
+    from matplotlib.path import Path
+    latlst, lonlst = np.asarray(latlst), np.asarray(lonlst)
+    labels = np.full((len(latlst), len(lonlst)), fill, dtype=np.int32)
+    for label, polygon in enumerate(polygons):
+        parts = [polygon] if np.ndim(polygon[0]) == 1 else polygon
+        for part in parts:
+            part = np.asarray(part, dtype=np.float64)
+            rows = np.flatnonzero((latlst >= part[:, 1].min()) & (latlst <= part[:, 1].max()))
+            cols = np.flatnonzero((lonlst >= part[:, 0].min()) & (lonlst <= part[:, 0].max()))
+            if len(rows) == 0 or len(cols) == 0:
+                continue
+            lon2D, lat2D = np.meshgrid(lonlst[cols], latlst[rows])
+            inside = Path(part).contains_points(np.column_stack([lon2D.ravel(), lat2D.ravel()]))
+            inside = inside.reshape(len(rows), len(cols))
+            box = labels[rows[:, np.newaxis], cols]
+            inside &= box == fill
+            box[inside] = label
+            labels[rows[:, np.newaxis], cols] = box
+    return labels
+
+
+class ZonalIndex:
+    def __init__(self, labels, latlst, lonlst, fill=-1) -> None:
+        """
+        Compact index of the cells of every region of a label grid (basins, countries...), built once:
+        the labelled cells sorted by region, so that the statistics of all regions are segmented
+        reductions (reduceat) of one gathered block of time steps.
+
+        Args:
+            labels (_type_): (lat, lon) int labels, e.g. from RasterizePolygons.
+            latlst (_type_): cell-center latitudes.
+            lonlst (_type_): cell-center longitudes.
+            fill (int, optional): label of the cells outside all regions. Defaults to -1.
+        """
+        labels = np.asarray(labels)
+        assert labels.shape == (len(latlst), len(lonlst)), "Shape of labels does not match lat, lon."
+        self.gridShape = labels.shape
+        flat = labels.ravel()
+        cells = np.flatnonzero(flat != fill)
+        order = np.argsort(flat[cells], kind='stable')
+        # labelled cells sorted by region, and the start of every region in them
+        self.cells = cells[order]
+        self.regions, self.starts, self.counts = np.unique(flat[self.cells], return_index=True, return_counts=True)
+        self.areas = np.broadcast_to(FromLatLonGetCellAreas(latlst, lonlst), self.gridShape).ravel()[self.cells]
+        self.regionAreas = np.add.reduceat(self.areas, self.starts)
+
+    @classmethod
+    def fromMasks(cls, masks, latlst, lonlst):
+        """
+        Index of a (region, lat, lon) stack of non-overlapping bool masks, region labels are their positions.
+        """
+        masks = np.asarray(masks, dtype=bool)
+        assert (masks.sum(axis=0) <= 1).all(), "Masks overlap, use one ZonalIndex per layer."
+        labels = np.where(masks.any(axis=0), masks.argmax(axis=0), -1)
+        return cls(labels, latlst, lonlst)
+
+    @timed('HYDRO_Generator.ZonalIndex.stats')
+    def stats(self, arr, stats=('mean',), memoryBudget=DEFAULT_MEMORY_BUDGET):
+        """
+        Statistics of all regions and all time steps, nan cells are skipped.
+
+        Args:
+            arr (_type_): 2D (lat, lon) or 3D (time, lat, lon) array, np.memmap or lazy array (read in blocks of time steps).
+            stats (tuple, optional): outputs among 'mean' (area-weighted), 'sum', 'min', 'max' and 'count' (valid cells).
+                Defaults to ('mean',).
+            memoryBudget (int, optional): bytes of one block of time steps. Defaults to 512 MB.
+
+        Returns:
+            dict: stat -> (time, region) table, (region,) for 2D input; regions are in self.regions order,
+                nan where a region has no valid cell.
+        """
+        for stat in stats:
+            assert stat in ZONAL_STATS, "stat must be one of {}, but given {}".format(ZONAL_STATS, stat)
+        assert len(arr.shape) in [2, 3], "Shape of data must be 2 or 3."
+        assert tuple(arr.shape[-2:]) == self.gridShape, \
+            "Shape of data {} does not match the labels {}.".format(arr.shape, self.gridShape)
+        is2D = len(arr.shape) == 2
+        NTime = 1 if is2D else arr.shape[0]
+        NRegion = len(self.regions)
+        results = {stat: np.empty((NTime, NRegion)) for stat in stats}
+        if NRegion == 0:
+            return {stat: res[0] if is2D else res for stat, res in results.items()}
+
+        step = max(1, memoryBudget // (self.gridShape[0] * self.gridShape[1] * 8 + len(self.cells) * 8 * 3))
+        currentSpan().set(regions=NRegion, cells=len(self.cells))
+        for start in range(0, NTime, step):
+            stop = min(start + step, NTime)
+            block = np.asarray(arr if is2D else arr[start:stop]).reshape(stop - start, -1)
+            # (time, labelled cell), sorted by region
+            values = block[:, self.cells].astype(np.float64)
+            isFinite = np.isfinite(values)
+            count = np.add.reduceat(isFinite, self.starts, axis=1)
+            isEmpty = count == 0
+            if 'count' in stats:
+                results['count'][start:stop] = count
+            if 'mean' in stats or 'sum' in stats:
+                filled = np.where(isFinite, values, 0)
+            if 'mean' in stats:
+                total = np.add.reduceat(filled * self.areas, self.starts, axis=1)
+                area = np.add.reduceat(isFinite * self.areas, self.starts, axis=1)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    results['mean'][start:stop] = np.where(isEmpty, np.nan, total / area)
+            if 'sum' in stats:
+                results['sum'][start:stop] = np.where(isEmpty, np.nan, np.add.reduceat(filled, self.starts, axis=1))
+            # fmin / fmax skip nan, regions without valid cell stay nan
+            if 'min' in stats:
+                results['min'][start:stop] = np.fmin.reduceat(values, self.starts, axis=1)
+            if 'max' in stats:
+                results['max'][start:stop] = np.fmax.reduceat(values, self.starts, axis=1)
+
+        if is2D:
+            results = {stat: res[0] for stat, res in results.items()}
+        return results
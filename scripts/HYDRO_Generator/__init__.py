@@ -1,7 +1,13 @@
 __version__ = '1.0'
 
 from .CoordsGen import LatCoords, LonCoords, TimeCoords
-from .XarrayDsGen import GenXarrayDS
-from .GlobalGridInfo import FromLatLonGetAreaMat, FromLatLonGetLandOrSea, haversine
+from .XarrayDsGen import GenXarrayDS, GenXarrayMultiDS, WriteXarrayDS
+from .GlobalGridInfo import FromLatLonGetAreaMat, FromLatLonGetCellAreas, AreaWeightedMean, FromLatLonGetLandOrSea, haversine
+from .Coarsen import CoarsenBlocks, CoarsenCoords
 from .Feb29 import fill_values_in_Feb29
-# from .GetDsElement import *
\ No newline at end of file
+from .GetDsElement import *
+from .PixelIndex import PixelIndex
+from .SpatialIndex import SpatialIndex
+from .LandMask import LandMaskCache, LandMaskFromIndex, LandMaskSeparable, SetLandMaskCacheDir
+from .Regrid import Regridder
+from .Zonal import RasterizePolygons, ZonalIndex
@@ -0,0 +1,174 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+import xarray as xr
+
+from HYDRO_Stats.TrendKernels import RESULT_KEYS
+
+
+def hashArray(arr, h=None):
+    """
+    blake2b digest of the dtype, shape and content of an array, read slice by slice along the 0th axis
+    so that memory maps and non-contiguous views are not copied as a whole.
+    """
+    h = hashlib.blake2b(digest_size=20) if h is None else h
+    arr = np.asanyarray(arr)
+    h.update('{}{}'.format(arr.dtype.str, arr.shape).encode())
+    if arr.flags['C_CONTIGUOUS']:
+        h.update(memoryview(arr.reshape(-1).view(np.uint8)))
+    else:
+        for sub in arr:
+            h.update(np.ascontiguousarray(sub).tobytes())
+    return h.hexdigest()
+
+
+class TrendCache:
+    def __init__(self, cacheDir=None, maxBytes=2 * 2**30) -> None:
+        """
+        Content-addressed on-disk cache of trend results.
+        An entry is keyed by a hash of the input (the array content, or the source file, variable and slice),
+        the method and the options, and stored as a compressed, chunked NetCDF file.
+        The least recently used entries are removed when the cache is larger than maxBytes.
+
+        Args:
+            cacheDir (str, optional): directory of the entries, created at the first write. Defaults to
+                HYDRO_TREND_CACHE if set, else HYDRO/trend in the user cache directory (XDG_CACHE_HOME or ~/.cache).
+            maxBytes (int, optional): size limit of the cache. Defaults to 2 GB.
+        """
+        if cacheDir is None:
+            cacheDir = os.environ.get('HYDRO_TREND_CACHE') or os.path.join(
+                os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'HYDRO', 'trend')
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+
+    def _entryPath(self, key):
+        return os.path.join(self.cacheDir, key + '.nc')
+
+    @staticmethod
+    def _key(sourceKey, detector, options):
+        h = hashlib.blake2b(digest_size=20)
+        h.update(json.dumps({'source': sourceKey, 'method': detector.method, 'backend': detector.backend,
+                             'options': options}, sort_keys=True, default=repr).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        The cached xarray.Dataset of key, or None.
+        """
+        path = self._entryPath(key)
+        if not os.path.isfile(path):
+            return None
+        with xr.open_dataset(path) as ds:
+            ds = ds.load()
+        os.utime(path)  # mark as recently used
+        return ds
+
+    def put(self, key, ds):
+        """
+        Store an xarray.Dataset of results under key, then evict old entries if needed.
+        """
+        encoding = {var: {'zlib': True, 'complevel': 4, 'chunksizes': tuple(min(256, n) for n in ds[var].shape)}
+                    for var in ds.data_vars}
+        os.makedirs(self.cacheDir, exist_ok=True)
+        tmpPath = self._entryPath(key) + '.tmp'
+        ds.to_netcdf(tmpPath, encoding=encoding)
+        os.replace(tmpPath, self._entryPath(key))
+        self.evict()
+
+    def remove(self, key):
+        if os.path.isfile(self._entryPath(key)):
+            os.remove(self._entryPath(key))
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits maxBytes.
+        """
+        if not os.path.isdir(self.cacheDir):
+            return
+        entries = [os.path.join(self.cacheDir, f) for f in os.listdir(self.cacheDir) if f.endswith('.nc')]
+        entries = sorted(entries, key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in entries)
+        while entries and total > self.maxBytes:
+            oldest = entries.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+
+    def clear(self):
+        if not os.path.isdir(self.cacheDir):
+            return
+        for f in os.listdir(self.cacheDir):
+            if f.endswith('.nc') or f == 'sources.json':
+                os.remove(os.path.join(self.cacheDir, f))
+
+    def trend3D(self, detector, arr, pixelIndex=None, fingerprint=None, **kwargs):
+        """
+        Cached TrendDetector.trend3D, keyed by fingerprint, or by the content of arr (a full pass over it,
+        even for a cache hit) without one.
+
+        Args:
+            detector (TrendDetector): gives the method and backend.
+            arr (_type_): 3D array, time-coord is the zero-th axis.
+            pixelIndex (PixelIndex, optional): passed to trend3D, part of the key.
+            fingerprint (_type_, optional): JSON-able identity of the content of arr given by the caller,
+                e.g. {'path': ..., 'mtime': ..., 'isel': ...} of the file it was read from; it must change
+                whenever the data change. Defaults to None (hash of the content).
+            **kwargs: other arguments of trend3D (memoryBudget, nWorkers), they do not change the results.
+
+        Returns:
+            dict: same as TrendDetector.trend3D.
+        """
+        options = {'pixelIndex': None if pixelIndex is None else hashArray(pixelIndex.mask)}
+        source = hashArray(arr) if fingerprint is None else {'fingerprint': fingerprint}
+        key = self._key(source, detector, options)
+        ds = self.get(key)
+        if ds is None:
+            resDict = detector.trend3D(arr, pixelIndex=pixelIndex, **kwargs)
+            self.put(key, xr.Dataset(data_vars={k: (['lat', 'lon'], resDict[k]) for k in RESULT_KEYS}))
+            return resDict
+        return {k: ds[k].values for k in RESULT_KEYS}
+
+    def trendFile(self, detector, path, variable, isel=None, pixelIndex=None, **kwargs):
+        """
+        Cached TrendDetector.trendDataArray of a variable of a NetCDF file, opened lazily.
+        The key uses the path, size and modification time of the file instead of its content,
+        and the previous entry of the same source is removed when the file has changed.
+
+        Args:
+            detector (TrendDetector): gives the method and backend.
+            path (str): NetCDF file.
+            variable (str): name of the 3D variable, time first.
+            isel (dict, optional): integer slices of dims, e.g. {'lat': slice(0, 100)}. Defaults to None.
+            pixelIndex (PixelIndex, optional): passed to trendDataArray, part of the key.
+            **kwargs: other arguments of trendDataArray (tileSize, memoryBudget), they do not change the results.
+
+        Returns:
+            xarray.Dataset: same as TrendDetector.trendDataArray.
+        """
+        isel = {} if isel is None else isel
+        stat = os.stat(path)
+        source = {'path': os.path.abspath(path), 'variable': variable,
+                  'isel': {dim: repr(sl) for dim, sl in isel.items()}}
+        options = {'pixelIndex': None if pixelIndex is None else hashArray(pixelIndex.mask)}
+        sourceId = self._key(source, detector, options)
+        key = self._key(dict(source, size=stat.st_size, mtime=stat.st_mtime_ns), detector, options)
+
+        indexPath = os.path.join(self.cacheDir, 'sources.json')
+        index = {}
+        if os.path.isfile(indexPath):
+            with open(indexPath) as f:
+                index = json.load(f)
+        if index.get(sourceId) not in [None, key]:
+            self.remove(index[sourceId])
+
+        ds = self.get(key)
+        if ds is None:
+            with xr.open_dataset(path) as src:
+                ds = detector.trendDataArray(src[variable].isel(isel), pixelIndex=pixelIndex, **kwargs)
+            self.put(key, ds)
+        index[sourceId] = key
+        os.makedirs(self.cacheDir, exist_ok=True)
+        with open(indexPath, "w", encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        return ds
@@ -1 +1,2 @@
-__version__ = '1.0'
\ No newline at end of file
+__version__ = '1.0'
+from .TrendCache import TrendCache, hashArray
\ No newline at end of file
@@ -0,0 +1,308 @@
+"""
+Timing and memory instrumentation of the entry points of the other packages.
+
+A span measures one call: elapsed time, items processed (pixels, time steps, tiles...),
+and the memory growth when memory tracing is on. Spans are opened with the `span` context
+manager or the `timed` decorator, finished spans are sent to the registered sinks.
+Without any sink, `span` returns a shared no-op object and `timed` calls the function
+directly, so the instrumentation costs one list check per call.
+
+    from HYDRO_Log import addSink, JsonLinesSink, ProgressSink
+    addSink(JsonLinesSink('./hydroLog/run.jsonl'))
+    addSink(ProgressSink())
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import functools
+import threading
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+_SINKS = []
+_MEMORY = {'mode': None}
+_LOCAL = threading.local()
+
+
+class Sink:
+    """
+    Base class of sinks. emit receives the record (dict) of every finished span,
+    progress receives the advances of spans with a known total.
+    """
+    def emit(self, record):
+        pass
+
+    def progress(self, name, done, total):
+        pass
+
+    def close(self):
+        pass
+
+
+class LogSink(Sink):
+    def __init__(self, path=None, level=logging.INFO, loggerName='HYDRO'):
+        """
+        One log line per span through the logging module, into path (or the handlers of the logger).
+        """
+        self.logger = logging.getLogger(loggerName)
+        self.level = level
+        self.handler = None
+        if path is not None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.handler = logging.FileHandler(path, encoding='utf-8')
+            self.handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s %(message)s'))
+            self.logger.addHandler(self.handler)
+            self.logger.setLevel(min(self.logger.level or level, level))
+
+    def emit(self, record):
+        msg = '{}{} {:.4f} s'.format('  ' * record['depth'], record['name'], record['seconds'])
+        if record['items']:
+            msg += ', {} items, {:.0f} items/s'.format(record['items'], record['itemsPerSecond'])
+        if record.get('peakBytes') is not None:
+            msg += ', peak +{:.1f} MB'.format(record['peakBytes'] / 2**20)
+        if record.get('maxRssBytes') is not None:
+            msg += ', max RSS +{:.1f} MB'.format(record['maxRssBytes'] / 2**20)
+        self.logger.log(self.level, msg)
+
+    def close(self):
+        if self.handler is not None:
+            self.logger.removeHandler(self.handler)
+            self.handler.close()
+
+
+class JsonLinesSink(Sink):
+    def __init__(self, path='./hydroLog/spans.jsonl'):
+        """
+        One JSON object per span, appended to path.
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.file = open(path, "a", encoding='utf-8')
+
+    def emit(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ProgressSink(Sink):
+    def __init__(self, stream=None, minInterval=0.5):
+        """
+        Plain-text progress for terminals and batch logs: spans with a total print 'name done/total (xx%)'
+        at most every minInterval seconds (on one line on a terminal), top-level spans print a summary.
+        """
+        self.stream = sys.stderr if stream is None else stream
+        self.minInterval = minInterval
+        self.isTty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self._last = {}
+
+    def progress(self, name, done, total):
+        now = time.perf_counter()
+        if done < total and now - self._last.get(name, 0) < self.minInterval:
+            return
+        self._last[name] = now
+        line = '{} {}/{} ({:.0%})'.format(name, done, total, done / total if total else 1)
+        if self.isTty:
+            self.stream.write('\r' + line + ('\n' if done >= total else ''))
+        else:
+            self.stream.write(line + '\n')
+        self.stream.flush()
+
+    def emit(self, record):
+        self._last.pop(record['name'], None)
+        if record['depth'] == 0:
+            self.stream.write('{} done in {:.2f} s\n'.format(record['name'], record['seconds']))
+            self.stream.flush()
+
+
+def addSink(sink):
+    """
+    Register a sink, instrumentation is enabled while at least one sink is registered.
+    """
+    _SINKS.append(sink)
+    return sink
+
+
+def removeSink(sink):
+    _SINKS.remove(sink)
+    sink.close()
+
+
+def clearSinks():
+    while _SINKS:
+        removeSink(_SINKS[-1])
+
+
+def isEnabled():
+    return bool(_SINKS)
+
+
+def setMemoryTracing(mode=None):
+    """
+    Memory measured by spans: None, 'tracemalloc' (peak growth of python/numpy allocations,
+    slows allocations down) or 'rss' (growth of the peak resident set size of the process).
+    """
+    assert mode in [None, 'tracemalloc', 'rss']
+    if mode == 'tracemalloc' and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif mode != 'tracemalloc' and _MEMORY['mode'] == 'tracemalloc':
+        tracemalloc.stop()
+    _MEMORY['mode'] = mode
+
+
+def _maxRss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024  # bytes on macOS, KB on Linux
+
+
+def _stack():
+    stack = getattr(_LOCAL, 'stack', None)
+    if stack is None:
+        stack = _LOCAL.stack = []
+    return stack
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, n=1):
+        pass
+
+    def advance(self, n=1):
+        pass
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, name, total=None, **fields):
+        self.name = name
+        self.total = total
+        self.items = 0
+        self.done = 0
+        self.fields = fields
+
+    def add(self, n=1):
+        """
+        Count n processed items (pixels, steps...), for the throughput.
+        """
+        self.items += n
+
+    def advance(self, n=1):
+        """
+        Count n finished units of total (blocks, tiles...) and report the progress to the sinks.
+        """
+        self.done += n
+        if self.total:
+            for sink in _SINKS:
+                sink.progress(self.name, self.done, self.total)
+
+    def set(self, **fields):
+        """
+        Extra fields of the record, e.g. shape or backend.
+        """
+        self.fields.update(fields)
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1] if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        self.mode = _MEMORY['mode']
+        if self.mode == 'tracemalloc':
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None:
+                self.parent._peak = max(self.parent._peak, peak)
+            tracemalloc.reset_peak()
+            self._startMemory = self._peak = current
+        elif self.mode == 'rss':
+            self._startMemory = _maxRss()
+        self.wallStart = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        seconds = time.perf_counter() - self.start
+        _stack().pop()
+        record = {'name': self.name, 'start': self.wallStart, 'seconds': seconds,
+                  'items': self.items, 'itemsPerSecond': self.items / seconds if seconds > 0 else None,
+                  'depth': self.depth, 'parent': None if self.parent is None else self.parent.name,
+                  'pid': os.getpid()}
+        if self.mode == 'tracemalloc' and tracemalloc.is_tracing():
+            peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            if self.parent is not None:
+                self.parent._peak = max(self.parent._peak, peak)
+            record['peakBytes'] = peak - self._startMemory
+        elif self.mode == 'rss' and self._startMemory is not None:
+            record['maxRssBytes'] = _maxRss() - self._startMemory
+        if excType is not None:
+            record['error'] = excType.__name__
+        record.update(self.fields)
+        for sink in _SINKS:
+            sink.emit(record)
+        return False
+
+
+def span(name, total=None, **fields):
+    """
+    Context manager measuring a block of code.
+
+    Args:
+        name (str): name of the record, e.g. 'HYDRO_Stats.trend3D'.
+        total (int, optional): number of units for progress reports by span.advance. Defaults to None.
+        **fields: extra fields of the record.
+
+    Returns:
+        Span: with add (items), advance (progress) and set (fields), a no-op object when disabled.
+    """
+    if not _SINKS:
+        return _NULL_SPAN
+    return Span(name, total, **fields)
+
+
+def currentSpan():
+    """
+    The innermost open span of this thread, or the no-op span.
+    """
+    stack = getattr(_LOCAL, 'stack', None)
+    return stack[-1] if _SINKS and stack else _NULL_SPAN
+
+
+def timed(name=None):
+    """
+    Decorator measuring every call of a function as a span, named module.qualname by default.
+    Inside the function, currentSpan() gives the span to count items or report progress.
+    """
+    def decorator(func):
+        spanName = name or '{}.{}'.format(func.__module__, func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _SINKS:
+                return func(*args, **kwargs)
+            with Span(spanName):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1 +1,4 @@
-__version__ = '1.0'
\ No newline at end of file
+__version__ = '1.0'
+
+from .Instrument import span, timed, currentSpan, addSink, removeSink, clearSinks, isEnabled, setMemoryTracing,\
+    Sink, LogSink, JsonLinesSink, ProgressSink
@@ -9,6 +9,7 @@ import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 
 from HYDRO_Plot.ColorBarFromFig import ColorBarFromFig
+from HYDRO_Log import timed
 
 
 def genGeoAxesJson(outputJsonPath='./hydroJson/DefaultGeoAxes.json', returnDict=False):
@@ -119,6 +120,7 @@ class GeoAxesPlot:
         self.ax.yaxis.set_major_formatter(lat_formatter)
         self.ax.gridlines(xlocs=lon_grids, ylocs=lat_grids, **kwargs)
     
+    @timed('HYDRO_Plot.GeoAxesPlot.stackImage')
     def stackImage(self, data, lat, lon, cmap='viridis', cmappcs=None, vmin=None, vmax=None):
         assert all(np.diff(lat) < 0), "Latitude is not descending!"
         assert len(data.shape)==2, "Only support 2D data, but given {}D".format(len(data.shape))
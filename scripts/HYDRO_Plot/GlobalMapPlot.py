@@ -16,6 +16,7 @@ import cartopy.feature as cfeature
 # import sys
 # sys.path.append('../')
 from HYDRO_Plot.ColorBarFromFig import ColorBarFromFig
+from HYDRO_Log import timed
 
 
 def genGlobalMapJson(outputJsonPath='./hydroJson/GlobalMap.json', returnDict=False):
@@ -189,6 +190,7 @@ class GlobalMapPlot:
         self.fig = fig
         self.ax = ax
     
+    @timed('HYDRO_Plot.GlobalMapPlot.stackImage')
     def stackImage(self, data, lat, lon, zorder=1):
         assert all(np.diff(lat) < 0), "Latitude is not descending!"
         assert len(data.shape)==2, "Only support 2D data, but given {}D".format(len(data.shape))
@@ -282,6 +284,7 @@ class GlobalMapPlot:
             
             cbar.set_ticks(ticks)
             
+    @timed('HYDRO_Plot.GlobalMapPlot.stackScatter')
     def stackScatter(self, data, lat, lon, zorder=0):
     
         data = np.array(data)
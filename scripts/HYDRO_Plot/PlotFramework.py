@@ -1,6 +1,7 @@
 import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
 from HYDRO_Plot.GeoAxesPlot import genGeoAxesJson, GeoAxesPlot
+from HYDRO_Log import timed
 
 class PlotFramework:
     def __init__(self,dpi=200):
@@ -121,6 +122,7 @@ class PlotFramework:
         
         return self.axs[-1]
     
+@timed('HYDRO_Plot.quick_map')
 def quick_map(lat, lon, data, cmap='hot_r', cmappcs=10, vmin=None, vmax=None, unit='Unit ($unit$)', **kwargs):
     '''
     快速绘制地图
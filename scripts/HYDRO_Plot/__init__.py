@@ -1,7 +1,43 @@
 __version__ = '1.0'
 
-from .GlobalMapPlot import genGlobalMapJson, GlobalMapPlot
-from .TrendPlot import genTrendPlotJson,TrendPlot,quickTrendPlot
-from .ColorBarFromFig import ColorBarFromFig
-from .PlotFramework import PlotFramework, quick_map
-from .GeoAxesPlot import genGeoAxesJson, GeoAxesPlot
+import sys
+import types
+import importlib
+
+# names are imported from their submodules at the first access (PEP 562),
+# so that `import HYDRO_Plot` does not load matplotlib, cartopy or PIL
+_LAZY = {
+    'genGlobalMapJson': '.GlobalMapPlot',
+    'GlobalMapPlot'   : '.GlobalMapPlot',
+    'genTrendPlotJson': '.TrendPlot',
+    'TrendPlot'       : '.TrendPlot',
+    'quickTrendPlot'  : '.TrendPlot',
+    'ColorBarFromFig' : '.ColorBarFromFig',
+    'PlotFramework'   : '.PlotFramework',
+    'quick_map'       : '.PlotFramework',
+    'genGeoAxesJson'  : '.GeoAxesPlot',
+    'GeoAxesPlot'     : '.GeoAxesPlot',
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        return getattr(importlib.import_module(_LAZY[name], __name__), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+class _LazyPackage(types.ModuleType):
+    def __setattr__(self, name, value):
+        # the import system binds a loaded submodule to the package, keep the class of the same name instead
+        if name in _LAZY and isinstance(value, types.ModuleType):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _LazyPackage
@@ -0,0 +1,147 @@
+import numpy as np
+
+from HYDRO_Stats.TrendKernels import DEFAULT_MEMORY_BUDGET, RESULT_KEYS, blockSize
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+SEASON_NAMES = ['DJF', 'MAM', 'JJA', 'SON']
+
+
+def groupLabels(time, grouping, waterYearStart=10):
+    """
+    Group names, and the group and the year of every time step for one grouping.
+
+    Args:
+        time (_type_): datetime-like 1D array.
+        grouping (str): 'month' (12 groups), 'season' (DJF/MAM/JJA/SON, December counts to the next year),
+            'annual' (calendar year) or 'wateryear' (starts in month waterYearStart, labelled by the year it ends).
+        waterYearStart (int, optional): first month of the water year. Defaults to 10.
+
+    Returns:
+        tuple: (names, group of every step, year of every step)
+    """
+    import pandas as pd
+    time = pd.DatetimeIndex(time)
+    month = np.asarray(time.month)
+    year = np.asarray(time.year)
+    if grouping == 'month':
+        return MONTH_NAMES, month - 1, year
+    elif grouping == 'season':
+        return SEASON_NAMES, (month % 12) // 3, year + (month == 12)
+    elif grouping == 'annual':
+        return ['annual'], np.zeros(len(month), dtype=int), year
+    elif grouping == 'wateryear':
+        return ['wateryear'], np.zeros(len(month), dtype=int), year + (month >= waterYearStart)
+    else:
+        raise ValueError("grouping must be 'month', 'season', 'annual' or 'wateryear', but given {}".format(grouping))
+
+
+def groupMatrix(time, groups=('month', 'season', 'annual'), waterYearStart=10):
+    """
+    Sparse (group * year, time) matrix of ones, a time step belongs to one row of every grouping.
+    Multiplying it with a (time, pixel) block aggregates all groups of all years at once.
+    A row is complete when it has the steps of every month of the group, e.g. the first DJF of data
+    starting in January, or the first and last water years, are not.
+
+    Returns:
+        tuple: (group names, years, matrix, complete) with complete the (group * year) bool of the rows.
+    """
+    import pandas as pd
+    from scipy import sparse
+    names, rowGroup, rowYear = [], [], []
+    for grouping in groups:
+        groupNames, g, y = groupLabels(time, grouping, waterYearStart)
+        rowGroup.append(g + len(names))
+        rowYear.append(y)
+        names += groupNames
+    # the year axis is the calendar years of the data, e.g. the DJF starting in the last December is dropped
+    calendarYear = np.asarray(pd.DatetimeIndex(time).year)
+    years = np.arange(calendarYear.min(), calendarYear.max() + 1)
+
+    NTime = len(time)
+    rows = np.concatenate([g * len(years) + (y - years[0]) for g, y in zip(rowGroup, rowYear)])
+    cols = np.tile(np.arange(NTime), len(groups))
+    inside = (np.concatenate(rowYear) >= years[0]) & (np.concatenate(rowYear) <= years[-1])
+    mat = sparse.csr_matrix((np.ones(inside.sum()), (rows[inside], cols[inside])),
+                            shape=(len(names) * len(years), NTime))
+
+    # steps of a full month: 1 for monthly data, else the days of the month / the time step (days)
+    monthStarts = pd.date_range('{}-01-01'.format(years[0] - 1), '{}-12-01'.format(years[-1] + 1), freq='MS')
+    stepDays = np.median(np.diff(pd.DatetimeIndex(time).values).astype('timedelta64[s]').astype(np.float64)) / 86400 \
+        if NTime > 1 else 31
+    monthSteps = np.ones(len(monthStarts)) if stepDays >= 27 else np.floor(monthStarts.days_in_month / stepDays + 1e-6)
+    expected = np.zeros(len(names) * len(years))
+    offset = 0
+    for grouping in groups:
+        groupNames, g, y = groupLabels(monthStarts, grouping, waterYearStart)
+        isIn = (y >= years[0]) & (y <= years[-1])
+        np.add.at(expected, ((g + offset) * len(years) + (y - years[0]))[isIn], monthSteps[isIn])
+        offset += len(groupNames)
+    complete = np.asarray(mat.sum(axis=1)).ravel() >= expected
+    return names, years, mat, complete
+
+
+def groupedTrend(detector, arr, time=None, groups=('month', 'season', 'annual'), how='mean',
+                 waterYearStart=10, memoryBudget=DEFAULT_MEMORY_BUDGET, completeOnly=True):
+    """
+    Trends of all groups (months, seasons, year...) in one pass over the data.
+    Every block of pixels is read once, aggregated to (group, year) values with one sparse
+    matrix product, and the trends of all groups are computed by one kernel call.
+
+    Args:
+        detector (TrendDetector): gives the method and backend.
+        arr (_type_): 3D numpy array or xarray.DataArray, time-coord is the zero-th axis.
+        time (_type_, optional): datetime-like 1D array. Defaults to the time coord of a DataArray.
+        groups (tuple, optional): groupings, see groupLabels. Defaults to ('month', 'season', 'annual').
+        how (str, optional): 'mean' or 'sum' of the valid values of a group in a year. Defaults to 'mean'.
+        waterYearStart (int, optional): first month of the water year. Defaults to 10.
+        memoryBudget (int, optional): bytes of working memory for one block of pixels. Defaults to 512 MB.
+        completeOnly (bool, optional): nan for the years of a group not fully covered by the time steps
+            (see groupMatrix), always applied for 'sum'. Defaults to True.
+
+    Returns:
+        xarray.Dataset: the six result fields with dims (group, lat, lon).
+    """
+    import xarray as xr
+    assert how in ['mean', 'sum']
+    assert len(arr.shape)==3, "Shape of data must be 3D (time, lat, lon)."
+    coords = {}
+    if isinstance(arr, xr.DataArray):
+        timeDim, latDim, lonDim = arr.dims
+        if time is None:
+            time = arr[timeDim].values
+        coords = {latDim: arr[latDim].values, lonDim: arr[lonDim].values}
+    else:
+        latDim, lonDim = 'lat', 'lon'
+    assert time is not None and len(time) == arr.shape[0], "Length of time does not match the data."
+
+    names, years, mat, complete = groupMatrix(time, groups, waterYearStart)
+    isDropped = ~complete if completeOnly or how == 'sum' else np.zeros(len(complete), dtype=bool)
+    NTime, NLat, NLon = arr.shape
+    NGroup, NYear = len(names), len(years)
+    kernel, kernelBytes = detector._kernel(NYear)
+
+    flat = arr.data.reshape(NTime, -1) if isinstance(arr, xr.DataArray) else np.asarray(arr).reshape(NTime, -1)
+    NPixel = flat.shape[1]
+    out = {key: np.full((NGroup, NPixel), np.nan, dtype=np.float32) for key in RESULT_KEYS}
+    step = blockSize(NTime * 8 * 2 + NGroup * (NYear * 8 * 2 + kernelBytes), memoryBudget)
+    for start in range(0, NPixel, step):
+        stop = min(start + step, NPixel)
+        Y = np.asarray(flat[:, start:stop], dtype=np.float64)
+        isFinite = np.isfinite(Y)
+        sums = mat @ np.where(isFinite, Y, 0)
+        counts = mat @ isFinite.astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            agg = sums / counts if how == 'mean' else sums
+        agg[counts == 0] = np.nan
+        agg[isDropped] = np.nan
+
+        # (group * year, pixel) -> (year, group * pixel): one kernel call for all groups
+        agg = agg.reshape(NGroup, NYear, -1).transpose(1, 0, 2).reshape(NYear, -1)
+        resDict = kernel(agg)
+        for key in RESULT_KEYS:
+            out[key][:, start:stop] = resDict[key].reshape(NGroup, -1)
+
+    coords['group'] = names
+    return xr.Dataset(data_vars={key: (['group', latDim, lonDim], out[key].reshape(NGroup, NLat, NLon))
+                                 for key in RESULT_KEYS},
+                      coords=coords)
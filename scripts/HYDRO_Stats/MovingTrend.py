@@ -0,0 +1,132 @@
+import numpy as np
+
+from HYDRO_Stats.TrendKernels import DEFAULT_MEMORY_BUDGET, RESULT_KEYS, blockSize, linearFromMoments
+
+
+def windowStarts(NTime, window, step=1):
+    """
+    First time index of every window of length window moved by step.
+    """
+    assert 2 <= window <= NTime, "window must be in [2, NTime]."
+    return np.arange(0, NTime - window + 1, step)
+
+
+def movingBytesPerPixel(NTime, window, step=1):
+    """
+    Bytes of working arrays used by movingLinearKernel for one pixel.
+    """
+    return (NTime + 1) * 8 * 8 + len(windowStarts(NTime, window, step)) * 8 * 16
+
+
+def movingLinearKernel(Y, window, step=1):
+    """
+    Linear trends of all moving windows for every pixel of a (time, pixel) block.
+    The sums of every window come from differences of cumulative sums along time,
+    so all windows cost O(time) per pixel instead of O(time * window).
+    Every window gives the same results as TrendKernels.linearTrendKernel on its slice
+    (intercept at the first step of the window, the same rule for invalid pixels).
+
+    Args:
+        Y (_type_): 2D array, time-coord is the zero-th axis.
+        window (int): length of a window.
+        step (int, optional): distance between window starts. Defaults to 1.
+
+    Returns:
+        dict: (window, pixel) float64 arrays keyed by RESULT_KEYS.
+    """
+    Y = np.asarray(Y, dtype=np.float64)
+    assert len(Y.shape)==2
+    NTime = Y.shape[0]
+    starts = windowStarts(NTime, window, step)
+
+    isFinite = np.isfinite(Y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # shift every pixel by its mean, so the differences of cumulative sums keep their precision
+        shift = np.where(isFinite, Y, 0).sum(axis=0) / isFinite.sum(axis=0)
+    shift[~np.isfinite(shift)] = 0
+    Z = np.where(isFinite, Y - shift, 0)
+    F = isFinite.astype(np.float64)
+    t = np.arange(NTime, dtype=np.float64)[:, np.newaxis]
+
+    def windowSum(a):
+        c = np.zeros((NTime + 1,) + a.shape[1:])
+        np.cumsum(a, axis=0, out=c[1:])
+        return c[starts + window] - c[starts]
+
+    n = windowSum(F)
+    nNonZero = windowSum((Y != 0).astype(np.float64))
+    Sx = windowSum(F * t)
+    Sxx = windowSum(F * t * t)
+    Sy = windowSum(Z)
+    Sxy = windowSum(Z * t)
+    Syy = windowSum(Z * Z)
+    del Z, F
+
+    # time counted from the first step of every window
+    s = starts[:, np.newaxis].astype(np.float64)
+    Sxy = Sxy - s * Sy
+    Sxx = Sxx - 2 * s * Sx + s * s * n
+    Sx = Sx - s * n
+    with np.errstate(invalid='ignore', divide='ignore'):
+        xMean = Sx / n
+        yMean = Sy / n
+        Cxx = Sxx - Sx * xMean
+        Cxy = Sxy - Sx * yMean
+        Cyy = Syy - Sy * yMean
+    n = np.rint(n)
+    isValid = (nNonZero > 0.5) & ((window - n) < window / 2)
+    return linearFromMoments(window, n, xMean, yMean + shift, Cxx, Cxy, Cyy, isValid)
+
+
+def movingTrend(detector, arr, window, step=1, memoryBudget=DEFAULT_MEMORY_BUDGET, pixelIndex=None):
+    """
+    Trend maps of all moving windows of a (time, lat, lon) cube.
+    The linear method uses movingLinearKernel, one pass over the time axis for all windows.
+    Sen's slope has no running form, so every window is given to the kernel of the detector.
+
+    Args:
+        detector (TrendDetector): gives the method and backend.
+        arr (_type_): 3D array, time-coord is the zero-th axis.
+        window (int): length of a window, in time steps.
+        step (int, optional): distance between window starts. Defaults to 1.
+        memoryBudget (int, optional): bytes of working memory for one block of pixels. Defaults to 512 MB.
+        pixelIndex (PixelIndex, optional): HYDRO_Generator.PixelIndex of the cells to compute. Defaults to None.
+
+    Returns:
+        dict: (window, lat, lon) float32 arrays keyed by RESULT_KEYS, and 'start', the first time index of every window.
+    """
+    if not isinstance(arr, np.ndarray):
+        arr = np.array(arr)
+    assert len(arr.shape)==3
+    NTime, NLat, NLon = arr.shape
+    starts = windowStarts(NTime, window, step)
+    NWindow = len(starts)
+    flat = arr.reshape(NTime, -1) if pixelIndex is None else pixelIndex.gather(arr)
+    NPixel = flat.shape[1]
+
+    if detector.method == 'linear':
+        bytesPerPixel = movingBytesPerPixel(NTime, window, step)
+    else:
+        kernel, kernelBytes = detector._kernel(window)
+        bytesPerPixel = kernelBytes + NWindow * 8 * len(RESULT_KEYS)
+
+    out = {key: np.full((NWindow, NPixel), np.nan, dtype=np.float32) for key in RESULT_KEYS}
+    blockStep = blockSize(bytesPerPixel, memoryBudget)
+    for start in range(0, NPixel, blockStep):
+        stop = min(start + blockStep, NPixel)
+        if detector.method == 'linear':
+            resDict = movingLinearKernel(flat[:, start:stop], window, step)
+            for key in RESULT_KEYS:
+                out[key][:, start:stop] = resDict[key]
+        else:
+            for w, s in enumerate(starts):
+                resDict = kernel(flat[s:s + window, start:stop])
+                for key in RESULT_KEYS:
+                    out[key][w, start:stop] = resDict[key]
+
+    if pixelIndex is None:
+        res = {key: out[key].reshape(NWindow, NLat, NLon) for key in RESULT_KEYS}
+    else:
+        res = {key: np.stack([pixelIndex.scatter(v) for v in out[key]]) for key in RESULT_KEYS}
+    res['start'] = starts
+    return res
@@ -0,0 +1,232 @@
+"""
+Compiled backend of the trend kernels, same interface and results as TrendKernels.
+The per-pixel loops run as nopython kernels with a parallel prange over pixels,
+compiled code is cached on disk (next to this file, or in NUMBA_CACHE_DIR).
+Numba is optional: check numbaAvailable() before using these kernels. It is imported and the
+kernels are compiled at the first check or call, so importing this module stays cheap.
+"""
+
+import importlib.util
+from functools import lru_cache
+
+import numpy as np
+
+from HYDRO_Stats.TrendKernels import RESULT_KEYS, linearFromMoments, mannKendallPValue
+
+# numba is installed, numbaAvailable tells if it can also be imported
+HAS_NUMBA = importlib.util.find_spec('numba') is not None
+
+
+def numbaBytesPerPixel(NTime):
+    """
+    Bytes of working arrays used by the compiled kernels for one pixel (the float64 input block
+    and the outputs, pairwise slopes only live in a few buffers per thread).
+    """
+    return NTime * 8 * 2 + 8 * 10
+
+
+def linearTrendKernelNumba(Y):
+    """
+    Compiled version of TrendKernels.linearTrendKernel.
+    """
+    Y = np.asarray(Y, dtype=np.float64)
+    assert len(Y.shape)==2
+    NTime = Y.shape[0]
+    n, nNonZero, xMean, yMean, Cxx, Cxy, Cyy = _compiled()['linearMoments'](Y)
+    isValid = (nNonZero > 0) & ((NTime - n) < NTime / 2)
+    return linearFromMoments(NTime, n, xMean, yMean, Cxx, Cxy, Cyy, isValid)
+
+
+def senTrendKernelNumba(Y):
+    """
+    Compiled version of TrendKernels.senTrendKernel.
+    """
+    Y = np.asarray(Y, dtype=np.float64)
+    assert len(Y.shape)==2
+    NTime = Y.shape[0]
+    compiled = _compiled()
+    n, nNonZero, slope, intercept, yMean, S, ytie, y1 = compiled['senStats'](Y, 4 * compiled['numThreads']())
+    isValid = (nNonZero > 0) & ((NTime - n) < NTime / 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pValue = mannKendallPValue(S, n, ytie, y1)
+        changeValue = slope * NTime
+        changeRatio = changeValue / yMean * 100
+
+    resDict = {'changeValue': changeValue,
+               'mean'       : yMean,
+               'changeRatio': changeRatio,
+               'pValue'     : pValue,
+               'slope'      : slope,
+               'intercept'  : intercept}
+    for key in RESULT_KEYS:
+        resDict[key][~isValid] = np.nan
+    return resDict
+
+
+@lru_cache(maxsize=None)
+def _compiled():
+    """
+    Import numba and compile the kernels (loaded from the on-disk cache after the first run).
+    None if numba can not be imported or compiled, e.g. a numba built against another numpy.
+    """
+    try:
+        from numba import get_num_threads, njit, prange
+    except Exception as e:
+        print("[Warning] numba can not be imported ({}), use numpy backend.".format(e))
+        return None
+
+    @njit(parallel=True, cache=True)
+    def _linearMoments(Y):
+        NTime, NPixel = Y.shape
+        n = np.zeros(NPixel, dtype=np.int64)
+        nNonZero = np.zeros(NPixel, dtype=np.int64)
+        xMean = np.full(NPixel, np.nan)
+        yMean = np.full(NPixel, np.nan)
+        Cxx = np.full(NPixel, np.nan)
+        Cxy = np.full(NPixel, np.nan)
+        Cyy = np.full(NPixel, np.nan)
+        for p in prange(NPixel):
+            cnt = 0
+            nz = 0
+            sx = 0.0
+            sy = 0.0
+            for t in range(NTime):
+                y = Y[t, p]
+                if y != 0:
+                    nz += 1
+                if np.isfinite(y):
+                    cnt += 1
+                    sx += t
+                    sy += y
+            n[p] = cnt
+            nNonZero[p] = nz
+            if cnt == 0:
+                continue
+            xm = sx / cnt
+            ym = sy / cnt
+            cxx = 0.0
+            cxy = 0.0
+            cyy = 0.0
+            for t in range(NTime):
+                y = Y[t, p]
+                if np.isfinite(y):
+                    dx = t - xm
+                    dy = y - ym
+                    cxx += dx * dx
+                    cxy += dx * dy
+                    cyy += dy * dy
+            xMean[p] = xm
+            yMean[p] = ym
+            Cxx[p] = cxx
+            Cxy[p] = cxy
+            Cyy[p] = cyy
+        return n, nNonZero, xMean, yMean, Cxx, Cxy, Cyy
+
+
+    @njit(parallel=True, cache=True)
+    def _senStats(Y, nChunks):
+        NTime, NPixel = Y.shape
+        n = np.zeros(NPixel, dtype=np.int64)
+        nNonZero = np.zeros(NPixel, dtype=np.int64)
+        slope = np.full(NPixel, np.nan)
+        intercept = np.full(NPixel, np.nan)
+        yMean = np.full(NPixel, np.nan)
+        S = np.zeros(NPixel)
+        ytie = np.zeros(NPixel)
+        y1 = np.zeros(NPixel)
+        # pixels are split in nChunks (a few per thread), the buffers of the series and of the
+        # pairwise slopes are allocated once per chunk, sized for the full series
+        nChunks = min(NPixel, nChunks)
+        for c in prange(nChunks):
+            vals = np.empty(NTime)
+            slopes = np.empty(NTime * (NTime - 1) // 2)
+            for p in range(c * NPixel // nChunks, (c + 1) * NPixel // nChunks):
+                cnt = 0
+                nz = 0
+                for t in range(NTime):
+                    y = Y[t, p]
+                    if y != 0:
+                        nz += 1
+                    if np.isfinite(y):
+                        vals[cnt] = y
+                        cnt += 1
+                n[p] = cnt
+                nNonZero[p] = nz
+                if cnt == 0:
+                    continue
+                yMean[p] = vals[:cnt].sum() / cnt
+
+                # pairwise slopes against the position in the nan-dropped series, and the sign sum S
+                k = 0
+                s = 0.0
+                for i in range(cnt):
+                    for j in range(i + 1, cnt):
+                        d = vals[j] - vals[i]
+                        slopes[k] = d / (j - i)
+                        k += 1
+                        if d > 0:
+                            s += 1
+                        elif d < 0:
+                            s -= 1
+                S[p] = s
+                # median of the slopes by selection in place (Wirth), the lower middle of an even
+                # count is then the largest slope before the middle
+                if cnt > 1:
+                    mid = k // 2
+                    lo = 0
+                    hi = k - 1
+                    while lo < hi:
+                        x = slopes[mid]
+                        i = lo
+                        j = hi
+                        while i <= j:
+                            while slopes[i] < x:
+                                i += 1
+                            while x < slopes[j]:
+                                j -= 1
+                            if i <= j:
+                                tmp = slopes[i]
+                                slopes[i] = slopes[j]
+                                slopes[j] = tmp
+                                i += 1
+                                j -= 1
+                        if j < mid:
+                            lo = i
+                        if mid < i:
+                            hi = j
+                    if k % 2:
+                        slope[p] = slopes[mid]
+                    else:
+                        slope[p] = (slopes[:mid].max() + slopes[mid]) / 2.0
+                # median of the series sorted in place
+                sortedVals = vals[:cnt]
+                sortedVals.sort()
+                yMedian = sortedVals[cnt // 2] if cnt % 2 else (sortedVals[cnt // 2 - 1] + sortedVals[cnt // 2]) / 2.0
+                intercept[p] = yMedian - slope[p] * (cnt - 1) / 2.0
+
+                # groups of tied values
+                run = 1.0
+                for i in range(1, cnt + 1):
+                    if i < cnt and sortedVals[i] == sortedVals[i - 1]:
+                        run += 1
+                    else:
+                        ytie[p] += run * (run - 1) / 2
+                        y1[p] += run * (run - 1) * (2 * run + 5)
+                        run = 1.0
+        return n, nNonZero, slope, intercept, yMean, S, ytie, y1
+
+    try:
+        # compile now (or load the cache), a broken installation fails here and not in trend3D
+        _linearMoments(np.zeros((2, 1)))
+        _senStats(np.zeros((2, 1)), 1)
+    except Exception as e:
+        print("[Warning] numba kernels can not be compiled ({}), use numpy backend.".format(e))
+        return None
+    return {'linearMoments': _linearMoments, 'senStats': _senStats, 'numThreads': get_num_threads}
+
+
+def numbaAvailable():
+    """
+    True if numba is installed and works, the kernels are compiled at the first check.
+    """
+    return HAS_NUMBA and _compiled() is not None
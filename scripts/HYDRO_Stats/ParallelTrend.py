@@ -0,0 +1,116 @@
+import os
+import mmap
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from HYDRO_Stats.TrendKernels import RESULT_KEYS
+
+# state of a worker process, set once by _initWorker
+_WORKER = {}
+
+
+def defaultWorkers():
+    """
+    Number of cpu cores usable by this process.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _startContext():
+    """
+    forkserver (or spawn) context: forked workers deadlock when the parent already runs
+    threads, e.g. the OpenMP / TBB pools of numba or of a BLAS.
+    """
+    return mp.get_context('forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn')
+
+
+def runBlocksParallel(flat, kernel, step, nWorkers, keys=RESULT_KEYS):
+    """
+    Run a (time, pixel) kernel over blocks of pixels in nWorkers processes.
+
+    The input is shared with the workers through a memory map (when flat is a np.memmap backed by a file)
+    or a shared memory block, never pickled. Every worker writes its results straight into one
+    preallocated shared (key, pixel) float32 array, which is returned as a dict of 1D arrays.
+    Since kernels reduce each pixel independently, the results do not depend on the blocking.
+    Workers are started fresh (forkserver or spawn), a dying worker raises BrokenProcessPool
+    and the shared memory is released in any case.
+
+    Args:
+        flat (_type_): 2D array (time, pixel).
+        kernel (_type_): function of TrendKernels, e.g. linearTrendKernel, or any picklable function
+            from a (time, pixel) block to a dict of 1D arrays.
+        step (int): number of pixels of one block.
+        nWorkers (int): number of processes.
+        keys (list, optional): keys of the kernel results to keep. Defaults to RESULT_KEYS.
+    """
+    NTime, NPixel = flat.shape
+    shms = []
+    try:
+        inSpec = _memmapSpec(flat)
+        if inSpec is None:
+            shmIn = shared_memory.SharedMemory(create=True, size=max(1, flat.nbytes))
+            shms.append(shmIn)
+            np.copyto(np.ndarray(flat.shape, dtype=flat.dtype, buffer=shmIn.buf), flat)
+            inSpec = ('shm', shmIn.name, flat.dtype.str, flat.shape, 0)
+
+        outShape = (len(keys), NPixel)
+        shmOut = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(outShape)) * 4))
+        shms.append(shmOut)
+        out = np.ndarray(outShape, dtype=np.float32, buffer=shmOut.buf)
+        out[:] = np.nan
+
+        blocks = [(start, min(start + step, NPixel)) for start in range(0, NPixel, step)]
+        with ProcessPoolExecutor(nWorkers, mp_context=_startContext(), initializer=_initWorker,
+                                 initargs=(inSpec, shmOut.name, outShape, kernel, keys)) as pool:
+            for _ in pool.map(_runBlock, blocks):
+                pass
+
+        res = {key: out[i].copy() for i, key in enumerate(keys)}
+        del out
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+    return res
+
+
+def _memmapSpec(flat):
+    """
+    (kind, filename, dtype, shape, offset) to reopen a read-only or read-write np.memmap in a worker,
+    None if flat is not a contiguous view of a file.
+    """
+    mm = getattr(flat, '_mmap', None)
+    if not isinstance(flat, np.memmap) or mm is None or flat.filename is None \
+            or flat.mode not in ('r', 'r+') or not flat.flags['C_CONTIGUOUS']:
+        return None
+    # flat may be a view starting after the beginning of the mapping
+    mmStart = flat.offset - flat.offset % mmap.ALLOCATIONGRANULARITY
+    offset = mmStart + flat.ctypes.data - np.frombuffer(mm, dtype=np.uint8).ctypes.data
+    return ('memmap', flat.filename, flat.dtype.str, flat.shape, offset)
+
+
+def _initWorker(inSpec, outName, outShape, kernel, keys):
+    kind, name, dtype, shape, offset = inSpec
+    if kind == 'memmap':
+        _WORKER['flat'] = np.memmap(name, dtype=dtype, mode='r', shape=shape, offset=offset)
+    else:
+        shmIn = shared_memory.SharedMemory(name=name)
+        _WORKER['shmIn'] = shmIn
+        _WORKER['flat'] = np.ndarray(shape, dtype=dtype, buffer=shmIn.buf)
+    shmOut = shared_memory.SharedMemory(name=outName)
+    _WORKER['shmOut'] = shmOut
+    _WORKER['out'] = np.ndarray(outShape, dtype=np.float32, buffer=shmOut.buf)
+    _WORKER['kernel'] = kernel
+    _WORKER['keys'] = keys
+
+
+def _runBlock(block):
+    start, stop = block
+    resDict = _WORKER['kernel'](_WORKER['flat'][:, start:stop])
+    for i, key in enumerate(_WORKER['keys']):
+        _WORKER['out'][i, start:stop] = resDict[key]
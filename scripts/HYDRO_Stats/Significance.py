@@ -0,0 +1,166 @@
+from functools import partial
+
+import numpy as np
+
+from HYDRO_Stats.TrendKernels import DEFAULT_MEMORY_BUDGET, blockSize, linearTrendKernel, validMask
+from HYDRO_Stats.ParallelTrend import defaultWorkers, runBlocksParallel
+from HYDRO_Log import timed
+
+
+SIGNIFICANCE_KEYS = ['slope', 'slopeLow', 'slopeHigh', 'pValue', 'pValueFDR', 'significant']
+
+
+def fdrAdjust(pValue, alpha=0.05):
+    """
+    Benjamini-Hochberg false discovery rate control over all finite p-values of a map.
+
+    Args:
+        pValue (_type_): p-values of any shape, nan is ignored.
+        alpha (float, optional): false discovery rate. Defaults to 0.05.
+
+    Returns:
+        tuple: adjusted p-values (nan where pValue is nan) and the bool mask of significant cells.
+    """
+    pValue = np.asarray(pValue, dtype=np.float64)
+    flat = pValue.ravel()
+    isFinite = np.isfinite(flat)
+    p = flat[isFinite]
+    order = np.argsort(p)
+    m = len(p)
+    adjusted = p[order] * m / np.arange(1, m + 1)
+    # step-up: the adjusted p-value is the minimum over all larger ranks
+    adjusted = np.minimum.accumulate(adjusted[::-1])[::-1]
+    qValue = np.full(flat.shape, np.nan)
+    qValue[np.flatnonzero(isFinite)[order]] = np.minimum(adjusted, 1)
+    qValue = qValue.reshape(pValue.shape)
+    with np.errstate(invalid='ignore'):
+        return qValue, qValue <= alpha
+
+
+def blockBootstrapIndices(NTime, nBoot=1000, blockLength=None, seed=None):
+    """
+    Moving block bootstrap: nBoot resamples of the time indices, each made of random blocks of
+    blockLength consecutive steps. Drawn once and shared by all pixels.
+
+    Args:
+        NTime (int): length of the series.
+        nBoot (int, optional): number of resamples. Defaults to 1000.
+        blockLength (int, optional): length of a block. Defaults to NTime ** (1/3).
+        seed (int, optional): seed of the random generator. Defaults to None.
+
+    Returns:
+        np.ndarray: (nBoot, NTime) int indices.
+    """
+    if blockLength is None:
+        blockLength = max(1, int(round(NTime ** (1 / 3))))
+    assert 1 <= blockLength <= NTime, "blockLength must be in [1, NTime]."
+    rng = np.random.default_rng(seed)
+    nBlock = -(-NTime // blockLength)
+    starts = rng.integers(0, NTime - blockLength + 1, size=(nBoot, nBlock))
+    indices = starts[:, :, np.newaxis] + np.arange(blockLength)
+    return indices.reshape(nBoot, -1)[:, :NTime]
+
+
+def bootstrapBytesPerPixel(NTime, nBoot):
+    """
+    Bytes of working arrays used by bootstrapSlopeKernel for one pixel.
+    """
+    return nBoot * NTime * 8 * 3
+
+
+def bootstrapSlopeKernel(Y, indices, alpha=0.05):
+    """
+    Block-bootstrap confidence interval of the linear slope for every pixel of a (time, pixel) block.
+    The residuals of the OLS fit are resampled with the shared indices and added back to the fitted line,
+    then the slopes of all resamples of all pixels are computed with array operations.
+
+    Args:
+        Y (_type_): 2D array, time-coord is the zero-th axis.
+        indices (_type_): (nBoot, time) from blockBootstrapIndices.
+        alpha (float, optional): the interval covers 1 - alpha. Defaults to 0.05.
+
+    Returns:
+        dict: 1D float64 arrays 'slope', 'slopeLow', 'slopeHigh', 'pValue'.
+    """
+    Y = np.asarray(Y, dtype=np.float64)
+    NTime = Y.shape[0]
+    fit = linearTrendKernel(Y)
+    _, _, isValid = validMask(Y)
+    t = np.arange(NTime, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fitted = fit['intercept'] + fit['slope'] * t[:, np.newaxis]
+        resid = np.where(np.isfinite(Y), Y - fitted, np.nan)
+
+        # (boot, time, pixel)
+        Rb = resid[indices]
+        mask = np.isfinite(Rb)
+        Rb += fitted
+        Rb[~mask] = 0
+        n = mask.sum(axis=1)
+        tm = mask * t[:, np.newaxis]
+        Sx = tm.sum(axis=1)
+        Sxx = (tm * t[:, np.newaxis]).sum(axis=1)
+        Sy = Rb.sum(axis=1)
+        Sxy = (Rb * t[:, np.newaxis]).sum(axis=1)
+        del tm, Rb, mask
+        slopes = (Sxy - Sx * Sy / n) / (Sxx - Sx * Sx / n)
+        slopes[n < 3] = np.nan
+
+        low, high = np.full((2, Y.shape[1]), np.nan)
+        if isValid.any():
+            low[isValid], high[isValid] = np.nanquantile(slopes[:, isValid], [alpha / 2, 1 - alpha / 2], axis=0)
+
+    return {'slope': fit['slope'], 'slopeLow': low, 'slopeHigh': high, 'pValue': fit['pValue']}
+
+
+@timed('HYDRO_Stats.fieldSignificance')
+def fieldSignificance(arr, nBoot=1000, blockLength=None, alpha=0.05, seed=None,
+                      memoryBudget=DEFAULT_MEMORY_BUDGET, nWorkers=1, pixelIndex=None):
+    """
+    Linear trend maps with block-bootstrap confidence intervals of the slope and
+    field significance of the trend p-values by false discovery rate control.
+
+    Args:
+        arr (_type_): 3D array, time-coord is the zero-th axis.
+        nBoot (int, optional): number of bootstrap resamples. Defaults to 1000.
+        blockLength (int, optional): length of bootstrap blocks. Defaults to NTime ** (1/3).
+        alpha (float, optional): level of the intervals and of the FDR. Defaults to 0.05.
+        seed (int, optional): seed of the resampling. Defaults to None.
+        memoryBudget (int, optional): bytes of working memory, shared by the workers. Defaults to 512 MB.
+        nWorkers (int, optional): number of processes, None for all cores. Defaults to 1.
+        pixelIndex (PixelIndex, optional): HYDRO_Generator.PixelIndex of the cells to compute. Defaults to None.
+
+    Returns:
+        dict: 2D maps keyed by SIGNIFICANCE_KEYS, 'significant' is the bool mask of FDR-significant cells.
+    """
+    if not isinstance(arr, np.ndarray):
+        arr = np.array(arr)
+    assert len(arr.shape)==3
+    NTime, NLat, NLon = arr.shape
+    flat = arr.reshape(NTime, -1) if pixelIndex is None else pixelIndex.gather(arr)
+    NPixel = flat.shape[1]
+
+    indices = blockBootstrapIndices(NTime, nBoot, blockLength, seed)
+    kernel = partial(bootstrapSlopeKernel, indices=indices, alpha=alpha)
+    keys = ['slope', 'slopeLow', 'slopeHigh', 'pValue']
+
+    if nWorkers is None:
+        nWorkers = defaultWorkers()
+    step = blockSize(bootstrapBytesPerPixel(NTime, nBoot), memoryBudget // max(1, nWorkers))
+    if nWorkers > 1:
+        out = runBlocksParallel(flat, kernel, max(1, min(step, -(-NPixel // (4 * nWorkers)))), nWorkers, keys)
+    else:
+        out = {key: np.full(NPixel, np.nan, dtype=np.float32) for key in keys}
+        for start in range(0, NPixel, step):
+            stop = min(start + step, NPixel)
+            resDict = kernel(flat[:, start:stop])
+            for key in keys:
+                out[key][start:stop] = resDict[key]
+
+    out['pValueFDR'], out['significant'] = fdrAdjust(out['pValue'], alpha)
+    out['pValueFDR'] = out['pValueFDR'].astype(np.float32)
+    if pixelIndex is None:
+        return {key: out[key].reshape(NLat, NLon) for key in SIGNIFICANCE_KEYS}
+    return {key: pixelIndex.scatter(out[key], fill=False if key == 'significant' else np.nan)
+            for key in SIGNIFICANCE_KEYS}
@@ -0,0 +1,168 @@
+import os
+import json
+
+import numpy as np
+
+from HYDRO_Stats.TrendKernels import DEFAULT_MEMORY_BUDGET, RESULT_KEYS, blockSize, linearFromMoments, mannKendallPValue, \
+                                     senBytesPerPixel, senTrendKernel
+
+
+
+class TrendAccumulator:
+    def __init__(self, path, shape=None, method='linear') -> None:
+        """
+        Keep per-pixel sufficient statistics of a growing (time, lat, lon) record, so that appending
+        new time slices costs O(new data) and the trend maps can be refreshed without the old record.
+        The state lives in the directory path; if it already holds a saved state, it is loaded
+        and shape and method are taken from it.
+
+        linear: counts, sums and cross-products of time and value (value shifted by its first valid
+                value to keep the sums accurate), the results are the same as TrendDetector.trend3D.
+        sen   : the Mann-Kendall S, the tie counts, and the record itself appended to a raw file,
+                since S is updated by comparing new values with the old ones and the median of
+                pairwise slopes has no sufficient statistic.
+
+        Args:
+            path (str): directory of the state.
+            shape (tuple, optional): (lat, lon) of the grid, needed for a new state.
+            method (str, optional): 'linear' or 'sen'. Defaults to 'linear'.
+        """
+        self.path = path
+        if os.path.isfile(os.path.join(path, 'state.json')):
+            self._load()
+            return
+
+        assert method in ['linear', 'sen']
+        assert shape is not None and len(shape)==2, "shape (lat, lon) is needed for a new state."
+        self.method = method
+        self.shape = tuple(int(i) for i in shape)
+        self.NTime = 0
+        NPixel = self.shape[0] * self.shape[1]
+        self.stats = {'n'        : np.zeros(NPixel, dtype=np.int64),
+                      'nNonZero' : np.zeros(NPixel, dtype=np.int64)}
+        if method == 'linear':
+            for key in ['shift', 'Sx', 'Sxx', 'Sy', 'Sxy', 'Syy']:
+                self.stats[key] = np.zeros(NPixel, dtype=np.float64)
+            self.stats['shift'][:] = np.nan
+        else:
+            for key in ['S', 'ytie', 'y1']:
+                self.stats[key] = np.zeros(NPixel, dtype=np.float64)
+        os.makedirs(path, exist_ok=True)
+
+    @property
+    def historyPath(self):
+        return os.path.join(self.path, 'history.f8')
+
+    def _load(self):
+        with open(os.path.join(self.path, 'state.json')) as f:
+            meta = json.load(f)
+        self.method = meta['method']
+        self.shape = tuple(meta['shape'])
+        self.NTime = meta['NTime']
+        with np.load(os.path.join(self.path, 'state.npz')) as npz:
+            self.stats = {key: npz[key] for key in npz.files}
+
+    def save(self):
+        """
+        Write the statistics to the state directory. The record of the sen method is already on disk.
+        """
+        np.savez(os.path.join(self.path, 'state.npz'), **self.stats)
+        with open(os.path.join(self.path, 'state.json'), "w", encoding='utf-8') as f:
+            json.dump({'method': self.method, 'shape': self.shape, 'NTime': self.NTime}, f, indent=2)
+
+    def update(self, arr, memoryBudget=DEFAULT_MEMORY_BUDGET):
+        """
+        Append new time slices.
+
+        Args:
+            arr (_type_): 2D (lat, lon) slice or 3D (time, lat, lon) slices following the current record.
+            memoryBudget (int, optional): bytes of old record read at once (sen). Defaults to 512 MB.
+        """
+        arr = np.asarray(arr)
+        if len(arr.shape)==2:
+            arr = arr[np.newaxis]
+        assert arr.shape[1:] == self.shape, \
+            "Shape of slices {} does not match the grid {}.".format(arr.shape[1:], self.shape)
+
+        for y in arr.reshape(arr.shape[0], -1).astype(np.float64):
+            if self.method == 'linear':
+                self._updateLinear(y)
+            else:
+                self._updateSen(y, memoryBudget)
+            self.NTime += 1
+
+    def _updateLinear(self, y):
+        st = self.stats
+        isFinite = np.isfinite(y)
+        first = isFinite & np.isnan(st['shift'])
+        st['shift'][first] = y[first]
+        d = np.where(isFinite, y - st['shift'], 0)
+        t = float(self.NTime)
+        st['n'] += isFinite
+        st['nNonZero'] += (y != 0)
+        st['Sx'] += isFinite * t
+        st['Sxx'] += isFinite * t * t
+        st['Sy'] += d
+        st['Sxy'] += d * t
+        st['Syy'] += d * d
+
+    def _updateSen(self, y, memoryBudget):
+        st = self.stats
+        isFinite = np.isfinite(y)
+        if self.NTime > 0:
+            old = np.memmap(self.historyPath, dtype='<f8', mode='r', shape=(self.NTime, y.shape[0]))
+            step = blockSize(self.NTime * 8 * 3, memoryBudget)
+            for start in range(0, y.shape[0], step):
+                stop = min(start + step, y.shape[0])
+                block = np.asarray(old[:, start:stop])
+                pair = np.isfinite(block) & isFinite[start:stop]
+                with np.errstate(invalid='ignore'):
+                    diff = y[start:stop] - block
+                st['S'][start:stop] += np.where(pair, np.sign(diff), 0).sum(axis=0)
+                # the group of values equal to the new one grows from k to k+1
+                k = (pair & (diff == 0)).sum(axis=0).astype(np.float64)
+                st['ytie'][start:stop] += k
+                st['y1'][start:stop] += np.where(isFinite[start:stop],
+                                                 (k + 1) * k * (2 * k + 7) - k * (k - 1) * (2 * k + 5), 0)
+            del old
+        st['n'] += isFinite
+        st['nNonZero'] += (y != 0)
+
+        with open(self.historyPath, 'ab') as f:
+            f.truncate(self.NTime * y.nbytes)
+            f.write(y.astype('<f8').tobytes())
+
+    def result(self, memoryBudget=DEFAULT_MEMORY_BUDGET):
+        """
+        Trend maps of the whole record, same dict of float32 2D arrays as TrendDetector.trend3D.
+        The linear method only reads the statistics, the sen method also reads the record
+        for the median of pairwise slopes.
+        """
+        st = self.stats
+        n = st['n']
+        isValid = (st['nNonZero'] > 0) & ((self.NTime - n) < self.NTime / 2)
+
+        if self.method == 'linear':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                xMean = st['Sx'] / n
+                yMean = st['shift'] + st['Sy'] / n
+                Cxx = st['Sxx'] - st['Sx'] * xMean
+                Cxy = st['Sxy'] - st['Sx'] * st['Sy'] / n
+                Cyy = st['Syy'] - st['Sy'] * st['Sy'] / n
+            resDict = linearFromMoments(self.NTime, n, xMean, yMean, Cxx, Cxy, Cyy, isValid)
+        else:
+            NPixel = n.shape[0]
+            resDict = {key: np.full(NPixel, np.nan) for key in RESULT_KEYS}
+            if self.NTime > 0:
+                record = np.memmap(self.historyPath, dtype='<f8', mode='r', shape=(self.NTime, NPixel))
+                step = blockSize(senBytesPerPixel(self.NTime), memoryBudget)
+                for start in range(0, NPixel, step):
+                    stop = min(start + step, NPixel)
+                    blockDict = senTrendKernel(record[:, start:stop])
+                    for key in RESULT_KEYS:
+                        resDict[key][start:stop] = blockDict[key]
+                del record
+            pValue = mannKendallPValue(st['S'], n, st['ytie'], st['y1'])
+            resDict['pValue'] = np.where(isValid, pValue, np.nan)
+
+        return {key: resDict[key].astype(np.float32).reshape(self.shape) for key in RESULT_KEYS}
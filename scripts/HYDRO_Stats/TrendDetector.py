@@ -1,21 +1,33 @@
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import statsmodels.formula.api as smf
-from scipy.stats.mstats import theilslopes
-from scipy.stats import kendalltau
-from tqdm.notebook import tqdm
+
+from HYDRO_Stats.TrendKernels import DEFAULT_MEMORY_BUDGET, RESULT_KEYS, blockSize, linearBytesPerPixel, linearTrendKernel,\
+                                     senBytesPerPixel, senTrendKernel
+from HYDRO_Stats.NumbaKernels import HAS_NUMBA, linearTrendKernelNumba, numbaAvailable, numbaBytesPerPixel, senTrendKernelNumba
+from HYDRO_Stats.ParallelTrend import defaultWorkers, runBlocksParallel
+from HYDRO_Stats.GroupedTrend import groupedTrend
+from HYDRO_Stats.MovingTrend import movingTrend
+from HYDRO_Log import currentSpan, span, timed
+
 
 class TrendDetector:    
-    def __init__(self, method='linear') -> None:
+    def __init__(self, method='linear', backend='numpy') -> None:
         """support both 1D and 3D, linear and sen method.
         -- Modified from my advisor MAO Ganquan
         
         Args:
             method (str, optional): 'linear' or 'sen'. Defaults to 'linear'.
+            backend (str, optional): kernels of the 3D methods, 'numpy' or 'numba' (compiled, parallel over pixels).
+                Falls back to 'numpy' if numba is not installed or can not be imported. Defaults to 'numpy'.
         """
         assert method in ['linear', 'sen']
+        assert backend in ['numpy', 'numba']
+        if backend == 'numba' and not numbaAvailable():
+            # numbaAvailable warns why an installed numba does not work
+            if not HAS_NUMBA:
+                print("[Warning] numba is not installed, use numpy backend.")
+            backend = 'numpy'
         self.method = method
+        self.backend = backend
 
     def trend1D(self, arr):
         if type(arr) != np.ndarray:
@@ -42,6 +54,8 @@ class TrendDetector:
         dataY = dataY[isNotNan]
         
         if self.method == 'linear':
+            import pandas as pd
+            import statsmodels.formula.api as smf
             fit = np.polyfit(dataX, dataY, 1)
             model = np.poly1d(fit)
             df = pd.DataFrame(columns=['y', 'x'])
@@ -52,6 +66,8 @@ class TrendDetector:
             slope = fit[0]
             intercept = fit[1]
         elif self.method=='sen':
+            from scipy.stats.mstats import theilslopes
+            from scipy.stats import kendalltau
             _, pValue = kendalltau(dataX, dataY)
             slope, intercept, _, _ = theilslopes(dataY)
         return {'changeValue': slope*len(arr),
@@ -61,40 +77,173 @@ class TrendDetector:
                 'slope'      : slope,
                 'intercept'  : intercept}
         
-    def trend3D(self, arr):
+    def _kernel(self, NTime):
+        if self.backend == 'numba':
+            if self.method == 'linear':
+                return linearTrendKernelNumba, numbaBytesPerPixel(NTime)
+            return senTrendKernelNumba, numbaBytesPerPixel(NTime)
+        if self.method == 'linear':
+            return linearTrendKernel, linearBytesPerPixel(NTime)
+        return senTrendKernel, senBytesPerPixel(NTime)
+    
+    @timed('HYDRO_Stats.trend3D')
+    def trend3D(self, arr, memoryBudget=DEFAULT_MEMORY_BUDGET, nWorkers=1, pixelIndex=None):
         """
         Args:
             arr (_type_): Please guarantee time-coord is the zero-th axis
+            memoryBudget (int, optional): bytes of working memory for one block of pixels,
+                the block size is derived from it. Defaults to 512 MB.
+            nWorkers (int, optional): number of processes, None for all cores. Workers read arr from
+                shared memory (or from its file if arr is a np.memmap) and the result is the same
+                as the serial one bit for bit. The numba backend ignores it, its kernels are
+                already parallel over pixels in this process. Defaults to 1.
+            pixelIndex (PixelIndex, optional): HYDRO_Generator.PixelIndex of the cells to compute,
+                e.g. land cells, the others are nan. Defaults to None (all cells).
         """
-        if type(arr) != np.ndarray:
+        if not isinstance(arr, np.ndarray):
             arr = np.array(arr)
         assert len(arr.shape)==3
         
-        changeValue2D   = np.full_like(arr[0], np.nan, dtype=np.float32)
-        mean2D          = np.full_like(arr[0], np.nan, dtype=np.float32)
-        changeRatio2D   = np.full_like(arr[0], np.nan, dtype=np.float32)
-        pValue2D        = np.full_like(arr[0], np.nan, dtype=np.float32)
-        slope2D         = np.full_like(arr[0], np.nan, dtype=np.float32)
-        intercept2D     = np.full_like(arr[0], np.nan, dtype=np.float32)
+        NTime, NLat, NLon = arr.shape
+        currentSpan().set(method=self.method, backend=self.backend, shape=list(arr.shape))
+        currentSpan().add(NLat * NLon)
+        if pixelIndex is None:
+            out = self._trendFlat(arr.reshape(NTime, NLat * NLon), memoryBudget, nWorkers)
+            return {key: out[key].reshape(NLat, NLon) for key in RESULT_KEYS}
         
-        NTime = arr.shape[0]
-        NLat = arr.shape[1]
-        NLon = arr.shape[2]
-        for i in tqdm(range(NLat)):
-            for j in range(NLon):
-                arr1D = arr[:,i,j]
-                resDict = self.trend1D(arr1D)
-                changeValue2D[i,j]  = resDict['changeValue']
-                mean2D[i,j]         = resDict['mean']
-                changeRatio2D[i,j]  = resDict['changeRatio']
-                pValue2D[i,j]       = resDict['pValue']
-                slope2D[i,j]        = resDict['slope']
-                intercept2D[i,j]    = resDict['intercept']
-                
-        return {'changeValue': changeValue2D,
-                'mean'       : mean2D,
-                'changeRatio': changeRatio2D,
-                'pValue'     : pValue2D,
-                'slope'      : slope2D,
-                'intercept'  : intercept2D}
-                
\ No newline at end of file
+        out = self._trendFlat(pixelIndex.gather(arr), memoryBudget, nWorkers)
+        return {key: pixelIndex.scatter(out[key]) for key in RESULT_KEYS}
+    
+    def _trendFlat(self, flat, memoryBudget, nWorkers):
+        """
+        Trend of a (time, pixel) array, dict of float32 1D arrays.
+        """
+        NTime, NPixel = flat.shape
+        kernel, bytesPerPixel = self._kernel(NTime)
+        
+        if nWorkers is None:
+            nWorkers = defaultWorkers()
+        if nWorkers > 1 and self.backend != 'numba':
+            # the budget is shared by the workers, and every worker gets several blocks to balance the load
+            step = max(1, min(blockSize(bytesPerPixel, memoryBudget // nWorkers), -(-NPixel // (4 * nWorkers))))
+            with span('HYDRO_Stats.trendBlocks', nWorkers=nWorkers) as sp:
+                sp.add(NPixel)
+                return runBlocksParallel(flat, kernel, step, nWorkers)
+        
+        out = {key: np.full(NPixel, np.nan, dtype=np.float32) for key in RESULT_KEYS}
+        step = blockSize(bytesPerPixel, memoryBudget)
+        with span('HYDRO_Stats.trendBlocks', total=-(-NPixel // step)) as sp:
+            for start in range(0, NPixel, step):
+                stop = min(start + step, NPixel)
+                resDict = kernel(flat[:, start:stop])
+                for key in RESULT_KEYS:
+                    out[key][start:stop] = resDict[key]
+                sp.add(stop - start)
+                sp.advance()
+        return out
+    
+    @timed('HYDRO_Stats.trendDataArray')
+    def trendDataArray(self, da, tileSize=None, memoryBudget=DEFAULT_MEMORY_BUDGET, pixelIndex=None):
+        """
+        Out-of-core trend3D for a (lazy or dask-chunked) xarray.DataArray, e.g. opened from NetCDF.
+        The grid is processed tile by tile, each tile reads the full time axis of its pixels only,
+        so the peak memory depends on the tile size instead of the dataset size.
+
+        Args:
+            da (_type_): 3D xarray.DataArray, time-coord is the zero-th dim.
+            tileSize (tuple, optional): (nLat, nLon) of a tile. Defaults to whole rows fitting memoryBudget,
+                or to the spatial dask chunks cut to memoryBudget for chunked arrays.
+            memoryBudget (int, optional): bytes of the tile and the kernel working memory. Defaults to 512 MB.
+            pixelIndex (PixelIndex, optional): HYDRO_Generator.PixelIndex of the cells to compute, tiles without
+                any of them are not read. Defaults to None (all cells).
+
+        Returns:
+            xarray.Dataset: the six result fields (float32) on the spatial coords of da.
+        """
+        import xarray as xr
+        assert len(da.shape)==3, "Shape of data must be 3D (time, lat, lon)."
+        NTime, NLat, NLon = da.shape
+        _, latDim, lonDim = da.dims
+        kernel, bytesPerPixel = self._kernel(NTime)
+        
+        if tileSize is None:
+            pixels = blockSize(bytesPerPixel + NTime * da.dtype.itemsize, memoryBudget)
+            tileSize = (max(1, min(NLat, pixels // NLon)), min(NLon, pixels))
+            if da.chunks is not None:
+                # spatial chunks, cut to the budget (time-only chunking spans the whole grid)
+                chunkLat, chunkLon = max(da.chunks[1]), max(da.chunks[2])
+                tileLon = min(chunkLon, pixels)
+                tileSize = (max(1, min(chunkLat, pixels // tileLon)), tileLon)
+        tileLat, tileLon = tileSize
+        
+        out = {key: np.full((NLat, NLon), np.nan, dtype=np.float32) for key in RESULT_KEYS}
+        nTile = -(-NLat // tileLat) * -(-NLon // tileLon)
+        with span('HYDRO_Stats.trendTiles', total=nTile) as sp:
+            for i in range(0, NLat, tileLat):
+                for j in range(0, NLon, tileLon):
+                    isel = {latDim: slice(i, i + tileLat), lonDim: slice(j, j + tileLon)}
+                    if pixelIndex is None:
+                        tileMask = None
+                    else:
+                        tileMask = pixelIndex.mask[i:i + tileLat, j:j + tileLon]
+                        if not tileMask.any():
+                            sp.advance()
+                            continue
+                    tile = da.isel(isel).values
+                    flat = tile.reshape(NTime, -1)
+                    if tileMask is None:
+                        resDict = kernel(flat)
+                    else:
+                        resDict = kernel(flat[:, tileMask.ravel()])
+                    for key in RESULT_KEYS:
+                        outTile = out[key][i:i + tileLat, j:j + tileLon]
+                        if tileMask is None:
+                            outTile[:] = resDict[key].reshape(tile.shape[1:])
+                        else:
+                            outTile[tileMask] = resDict[key]
+                    sp.add(flat.shape[1] if tileMask is None else int(tileMask.sum()))
+                    sp.advance()
+                    del tile, flat
+        
+        return xr.Dataset(data_vars={key: ([latDim, lonDim], out[key]) for key in RESULT_KEYS},
+                          coords={latDim: da[latDim], lonDim: da[lonDim]})
+
+    @timed('HYDRO_Stats.trendGroups')
+    def trendGroups(self, arr, time=None, groups=('month', 'season', 'annual'), how='mean',
+                    waterYearStart=10, memoryBudget=DEFAULT_MEMORY_BUDGET, completeOnly=True):
+        """
+        Trends of every month, season, year... of a daily or monthly cube in one pass,
+        see HYDRO_Stats.GroupedTrend.groupedTrend.
+        
+        Args:
+            arr (_type_): 3D numpy array or xarray.DataArray, time-coord is the zero-th axis.
+            time (_type_, optional): datetime-like 1D array. Defaults to the time coord of a DataArray.
+            groups (tuple, optional): any of 'month', 'season', 'annual', 'wateryear'. Defaults to ('month', 'season', 'annual').
+            how (str, optional): 'mean' or 'sum' of a group in a year. Defaults to 'mean'.
+            waterYearStart (int, optional): first month of the water year. Defaults to 10.
+            memoryBudget (int, optional): bytes of working memory for one block of pixels. Defaults to 512 MB.
+            completeOnly (bool, optional): nan for the years a group is only partly covered, always for 'sum'. Defaults to True.
+
+        Returns:
+            xarray.Dataset: the six result fields with dims (group, lat, lon).
+        """
+        return groupedTrend(self, arr, time, groups, how, waterYearStart, memoryBudget, completeOnly)
+
+    @timed('HYDRO_Stats.trendMovingWindow')
+    def trendMovingWindow(self, arr, window, step=1, memoryBudget=DEFAULT_MEMORY_BUDGET, pixelIndex=None):
+        """
+        Trend maps of every window of length window moved by step, e.g. 30-year windows of annual data,
+        see HYDRO_Stats.MovingTrend.movingTrend. The linear method computes all windows from
+        cumulative sums in one pass, every window equals trend3D(arr[s:s + window]).
+
+        Args:
+            arr (_type_): 3D array, time-coord is the zero-th axis.
+            window (int): length of a window, in time steps.
+            step (int, optional): distance between window starts. Defaults to 1.
+            memoryBudget (int, optional): bytes of working memory for one block of pixels. Defaults to 512 MB.
+            pixelIndex (PixelIndex, optional): HYDRO_Generator.PixelIndex of the cells to compute. Defaults to None.
+
+        Returns:
+            dict: (window, lat, lon) arrays of the six result fields, and 'start' of every window.
+        """
+        return movingTrend(self, arr, window, step, memoryBudget, pixelIndex)
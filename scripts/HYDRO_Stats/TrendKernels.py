@@ -0,0 +1,265 @@
+from functools import lru_cache
+
+import numpy as np
+
+RESULT_KEYS = ['changeValue', 'mean', 'changeRatio', 'pValue', 'slope', 'intercept']
+
+# bytes of working memory for one block, the default of every blocked computation
+DEFAULT_MEMORY_BUDGET = 512 * 2**20
+
+
+def linearBytesPerPixel(NTime):
+    """
+    Bytes of working arrays used by linearTrendKernel for one pixel.
+    """
+    return NTime * 8 * 4
+
+
+def senBytesPerPixel(NTime):
+    """
+    Bytes of working arrays used by senTrendKernel for one pixel: all pairwise slopes,
+    plus the series, the ranks and the temporaries of one chunk of pairs.
+    """
+    return (NTime * (NTime - 1) // 2) * 8 + NTime * 8 * 8
+
+
+def validMask(Y):
+    """
+    Given a (time, pixel) block, return the finite mask, the number of finite values and
+    the pixels which are valid under the same rule as TrendDetector.trend1D:
+    not all zero, and the number of nan and inf less than half of the series length.
+    """
+    NTime = Y.shape[0]
+    isFinite = np.isfinite(Y)
+    nValid = isFinite.sum(axis=0)
+    allZero = ~np.any(Y != 0, axis=0)
+    isValid = ~allZero & ((NTime - nValid) < NTime / 2)
+    return isFinite, nValid, isValid
+
+
+def blockSize(bytesPerPixel, memoryBudget):
+    """
+    Number of pixels processed together so that the working arrays of a kernel
+    stay within memoryBudget (bytes).
+    """
+    return max(1, int(memoryBudget // max(1, bytesPerPixel)))
+
+
+def linearTrendKernel(Y):
+    """
+    Closed-form OLS trend for every pixel of a (time, pixel) block at once.
+
+    The slope and intercept are the least-squares fit against the time index (same as np.polyfit),
+    the pValue is the F-test of the regression (same as statsmodels' f_pvalue).
+    Pixels rejected by validMask are nan.
+
+    Args:
+        Y (_type_): 2D array, time-coord is the zero-th axis.
+
+    Returns:
+        dict: 1D float64 arrays keyed by RESULT_KEYS.
+    """
+    Y = np.asarray(Y, dtype=np.float64)
+    assert len(Y.shape)==2
+    NTime = Y.shape[0]
+    isFinite, n, isValid = validMask(Y)
+
+    # (pixel, time) layout: every pixel is reduced along its own contiguous row,
+    # so the result of a pixel does not depend on how pixels are grouped into blocks
+    F = isFinite.T.astype(np.float64)
+    Yt = np.where(isFinite, Y, 0).T.copy()
+    t = np.arange(NTime, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Sx = (F * t).sum(axis=1)
+        Sxx = (F * (t * t)).sum(axis=1)
+        xMean = Sx / n
+        yMean = Yt.sum(axis=1) / n
+
+        # center y on its own mean (invalid steps stay zero), sums stay accurate for large values
+        Yt -= yMean[:, np.newaxis]
+        Yt *= F
+        Cxy = (Yt * t).sum(axis=1)
+        Cyy = (Yt * Yt).sum(axis=1)
+        Cxx = Sxx - Sx * xMean
+
+    return linearFromMoments(NTime, n, xMean, yMean, Cxx, Cxy, Cyy, isValid)
+
+
+def linearFromMoments(NTime, n, xMean, yMean, Cxx, Cxy, Cyy, isValid):
+    """
+    OLS trend results from the per-pixel moments of the valid values: count n, means of time and value,
+    centered sums of squares Cxx, Cyy and cross-products Cxy. Pixels where isValid is False are nan.
+    """
+    from scipy import special
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = Cxy / Cxx
+        intercept = yMean - slope * xMean
+        SSR = slope * Cxy
+        SSE = np.maximum(Cyy - SSR, 0)
+        dof = n - 2.0
+        fValue = SSR / (SSE / dof)
+        pValue = np.where(dof > 0, special.fdtrc(1, np.maximum(dof, 1), fValue), np.nan)
+
+        changeValue = slope * NTime
+        changeRatio = changeValue / yMean * 100
+
+    resDict = {'changeValue': changeValue,
+               'mean'       : np.array(yMean, dtype=np.float64),
+               'changeRatio': changeRatio,
+               'pValue'     : pValue,
+               'slope'      : slope,
+               'intercept'  : intercept}
+    for key in RESULT_KEYS:
+        resDict[key][~isValid] = np.nan
+    return resDict
+
+
+def senTrendKernel(Y):
+    """
+    Sen's slope and Mann-Kendall test for every pixel of a (time, pixel) block at once.
+
+    Same results as TrendDetector.trend1D with method='sen': the slope is the median of all pairwise
+    slopes of the valid values (theilslopes on the nan-dropped series), the pValue is the two-sided
+    Kendall tau test against time, exact for short series without ties and otherwise from the normal
+    approximation of S with tie-corrected variance.
+
+    Args:
+        Y (_type_): 2D array, time-coord is the zero-th axis.
+
+    Returns:
+        dict: 1D float64 arrays keyed by RESULT_KEYS.
+    """
+    Y = np.array(Y, dtype=np.float64)
+    assert len(Y.shape)==2
+    NTime = Y.shape[0]
+    isFinite, n, isValid = validMask(Y)
+
+    # (pixel, time) layout so that per-pixel work runs along contiguous memory
+    Yt = np.where(isFinite, Y, np.nan).T.copy()
+    rank = np.cumsum(isFinite, axis=0).T.astype(np.float64)
+    iu, ju = np.triu_indices(NTime, 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # the slopes are the only (pixel, pair) array, filled by chunks of NTime pairs
+        slopes = np.empty((Yt.shape[0], len(iu)))
+        S = np.zeros(Yt.shape[0])
+        for start in range(0, len(iu), NTime):
+            i, j = iu[start:start + NTime], ju[start:start + NTime]
+            dy = Yt[:, j] - Yt[:, i]
+            S += np.nansum(np.sign(dy), axis=1)
+            np.divide(dy, rank[:, j] - rank[:, i], out=slopes[:, start:start + NTime])
+        del dy
+        slopes.sort(axis=1)
+
+        nPairs = n * (n - 1) // 2
+        slope = _sortedMedian(slopes, nPairs)
+        del slopes
+
+        yMean = np.nansum(Yt, axis=1) / n
+        Yt.sort(axis=1)
+        yMedian = _sortedMedian(Yt, n)
+        intercept = yMedian - slope * (n - 1) / 2.0
+
+        ytie, y1 = _tieCounts(Yt, n)
+        pValue = mannKendallPValue(S, n, ytie, y1)
+
+        changeValue = slope * NTime
+        changeRatio = changeValue / yMean * 100
+
+    resDict = {'changeValue': changeValue,
+               'mean'       : yMean,
+               'changeRatio': changeRatio,
+               'pValue'     : pValue,
+               'slope'      : slope,
+               'intercept'  : intercept}
+    for key in RESULT_KEYS:
+        resDict[key][~isValid] = np.nan
+    return resDict
+
+
+def _sortedMedian(sortedArr, count):
+    """
+    Median of the first count values of each row of an array sorted along axis 1 (nan at the end).
+    """
+    count = np.asarray(count, dtype=np.int64)
+    lo = np.clip((count - 1) // 2, 0, sortedArr.shape[1] - 1)
+    hi = np.clip(count // 2, 0, sortedArr.shape[1] - 1)
+    median = (np.take_along_axis(sortedArr, lo[:, np.newaxis], axis=1)[:, 0] +
+              np.take_along_axis(sortedArr, hi[:, np.newaxis], axis=1)[:, 0]) / 2
+    median[count == 0] = np.nan
+    return median
+
+
+def _tieCounts(sortedArr, count):
+    """
+    For rows sorted along axis 1 (nan at the end), return the number of tied pairs
+    and sum of t(t-1)(2t+5) over the groups of tied values.
+    """
+    NPixel, NTime = sortedArr.shape
+    starts = np.ones(sortedArr.shape, dtype=bool)
+    starts[:, 1:] = sortedArr[:, 1:] != sortedArr[:, :-1]
+    inside = np.arange(NTime) < np.asarray(count)[:, np.newaxis]
+
+    runId = np.cumsum(starts.ravel()) - 1
+    runLen = np.bincount(runId[inside.ravel()], minlength=runId[-1] + 1).astype(np.float64)
+    runRow = np.flatnonzero(starts.ravel()) // NTime
+    ytie = np.bincount(runRow, weights=runLen * (runLen - 1) / 2, minlength=NPixel)
+    y1 = np.bincount(runRow, weights=runLen * (runLen - 1) * (2 * runLen + 5), minlength=NPixel)
+    return ytie, y1
+
+
+def mannKendallPValue(S, n, ytie, y1):
+    """
+    Two-sided p-value of the Mann-Kendall statistic S (n valid values, ytie tied pairs and
+    y1 the sum of t(t-1)(2t+5) over groups of tied values) with the same choice of method as
+    scipy.stats.kendalltau(method='auto'): exact distribution when there are no ties and
+    n <= 33 (or almost all pairs agree), otherwise the normal approximation with tie correction.
+    """
+    from scipy import special
+    n = np.asarray(n, dtype=np.float64)
+    tot = n * (n - 1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var = (n * (n - 1) * (2 * n + 5) - y1) / 18
+        pValue = special.erfc(np.abs(S) / np.sqrt(var) / np.sqrt(2))
+
+    dis = (tot - ytie - S) / 2
+    isExact = (ytie == 0) & ((n <= 33) | (np.minimum(dis, tot - dis) <= 1)) & (tot > 0)
+    for nExact in np.unique(n[isExact]):
+        sel = isExact & (n == nExact)
+        pValue[sel] = _kendallExactPValue(int(nExact), (tot[sel] - dis[sel]).astype(np.int64))
+
+    pValue[(ytie == tot) | (n < 2)] = np.nan
+    return pValue
+
+
+def _kendallExactPValue(n, c):
+    """
+    Two-sided exact p-value of Kendall's tau for n values without ties, c concordant pairs.
+    """
+    from scipy import special
+    tot = n * (n - 1) // 2
+    c = np.minimum(c, tot - c)
+    if n <= 2:
+        return np.ones(c.shape)
+    if n > 33:
+        # only reached when c <= 1
+        return np.clip(2.0 * np.exp(-special.gammaln(np.where(c == 0, n + 1, n))), 0, 1)
+    prob = 2.0 * _kendallCdf(n)[c]
+    prob[4 * c == n * (n - 1)] = 1.0
+    return np.clip(prob, 0, 1)
+
+
+@lru_cache(maxsize=None)
+def _kendallCdf(n):
+    """
+    Cumulative distribution of the number of concordant pairs among n values without ties.
+    """
+    from scipy import special
+    counts = np.ones(1)
+    for j in range(2, n + 1):
+        # number of permutations of j values with k inversions
+        cs = np.concatenate(([0], np.cumsum(counts)))
+        k = np.arange(len(counts) + j - 1)
+        new = cs[np.minimum(k + 1, len(counts))] - cs[np.maximum(k - j + 1, 0)]
+        counts = new
+    return np.cumsum(counts) / np.exp(special.gammaln(n + 1))
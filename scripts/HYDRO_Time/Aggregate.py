@@ -0,0 +1,188 @@
+import sys
+
+import numpy as np
+
+from HYDRO_Log import currentSpan, timed
+
+AGGREGATE_FREQS = ['month', 'season', 'year', 'waterYear']
+AGGREGATE_STATS = ['mean', 'sum', 'min', 'max', 'count']
+DEFAULT_SEASONS = {'DJF': [12, 1, 2], 'MAM': [3, 4, 5], 'JJA': [6, 7, 8], 'SON': [9, 10, 11]}
+# bytes of one block of time steps
+DEFAULT_MEMORY_BUDGET = 512 * 2**20
+
+
+def _yearMonth(time):
+    """
+    Year and month of datetime64 (or pandas) times, or of cftime dates.
+    """
+    time = np.asarray(time)
+    if np.issubdtype(time.dtype, np.datetime64):
+        year = time.astype('datetime64[Y]').astype(np.int64) + 1970
+        month = time.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        return year, month
+    return np.array([t.year for t in time]), np.array([t.month for t in time])
+
+
+class TimeAggregator:
+    def __init__(self, time, freq='month', seasons=None, waterYearStart=10) -> None:
+        """
+        Aggregation of a time series (or cube) to months, seasons, years or water years.
+        The periods of the time coord are found once, as the segments of consecutive steps of each period,
+        then whole cubes are reduced by segmented reductions (reduceat) of blocks of time steps.
+
+        Args:
+            time (_type_): sorted 1D time coord, datetime64, pandas or cftime.
+            freq (str, optional): 'month', 'season', 'year' or 'waterYear'. Defaults to 'month'.
+            seasons (dict, optional): name -> adjacent months (in any order) of non-overlapping seasons for 'season',
+                a season across the new year belongs to the year of its last month (Dec 2000 is in DJF 2001);
+                months of no season are left out. Defaults to DJF, MAM, JJA, SON.
+            waterYearStart (int, optional): first month of the water year for 'waterYear', a water year
+                is named by the year it ends in. Defaults to 10 (October).
+        """
+        assert freq in AGGREGATE_FREQS, "freq must be one of {}, but given {}".format(AGGREGATE_FREQS, freq)
+        self.time = np.asarray(time)
+        self.freq = freq
+        year, month = _yearMonth(self.time)
+        assert len(year) > 0, "time is empty."
+        assert np.all(year[1:] * 12 + month[1:] >= year[:-1] * 12 + month[:-1]), "time must be sorted."
+
+        if freq == 'month':
+            key = year * 12 + month - 1
+            names = lambda k: '{:04d}-{:02d}'.format(k // 12, k % 12 + 1)
+        elif freq == 'year':
+            key = year
+            names = lambda k: '{:04d}'.format(k)
+        elif freq == 'waterYear':
+            assert 1 <= waterYearStart <= 12
+            key = year + (month >= waterYearStart) if waterYearStart > 1 else year
+            names = lambda k: 'WY{:04d}'.format(k)
+        else:
+            seasons = DEFAULT_SEASONS if seasons is None else seasons
+            seasonNames = list(seasons)
+            seasonOf = np.full(13, -1)
+            nextYear = np.zeros(13, dtype=np.int64)
+            for i, (name, months) in enumerate(seasons.items()):
+                months = sorted(set(months))
+                assert (seasonOf[months] == -1).all(), "Seasons overlap."
+                seasonOf[months] = i
+                # first month of the season in its cycle: the one whose previous month is not in it
+                firsts = [m for m in months if (m - 2) % 12 + 1 not in months]
+                assert len(firsts) <= 1, "Months of season {} are not adjacent: {}".format(name, months)
+                # a season across the new year (with Dec and Jan, not the whole year):
+                # its months from the first one to December are in the next year
+                if firsts and 12 in months and 1 in months:
+                    nextYear[[m for m in months if m >= firsts[0]]] = 1
+            NSeason = len(seasonNames)
+            key = np.where(seasonOf[month] >= 0, (year + nextYear[month]) * NSeason + seasonOf[month], -1)
+            names = lambda k: '{:04d}-{}'.format(k // NSeason, seasonNames[k % NSeason])
+
+        # segments of consecutive steps with the same key, those of left-out months are dropped
+        isStart = np.concatenate(([True], key[1:] != key[:-1]))
+        self.segment = np.cumsum(isStart) - 1
+        segmentKey = key[isStart]
+        self.segmentStarts = np.flatnonzero(isStart)
+        # period of every segment, -1 for the dropped ones
+        isKept = segmentKey >= 0
+        self.segmentPeriod = np.where(isKept, np.cumsum(isKept) - 1, -1)
+        self.starts = self.segmentStarts[isKept]
+        self.counts = np.diff(np.append(self.segmentStarts, len(key)))[isKept]
+        self.labels = [names(k) for k in segmentKey[isKept]]
+        self.startTimes = self.time[self.starts]
+
+    def __len__(self):
+        return len(self.starts)
+
+    @timed('HYDRO_Time.TimeAggregator.aggregate')
+    def aggregate(self, arr, stats=('mean',), minCount=1, memoryBudget=DEFAULT_MEMORY_BUDGET):
+        """
+        Reduce every period of a (time, ...) array, nan values are skipped. The time axis is read in blocks
+        (np.memmap, netCDF variables and lazy arrays are not loaded as a whole), and the partial results
+        of a period cut by a block are merged, so periods may be longer than a block.
+
+        Args:
+            arr (_type_): (time, ...) numpy array, np.memmap or xarray.DataArray with time first.
+            stats (tuple, optional): outputs among 'mean', 'sum', 'min', 'max' and 'count' (valid values).
+                Defaults to ('mean',).
+            minCount (int, optional): mean, sum, min and max are nan for periods with fewer valid values. Defaults to 1.
+            memoryBudget (int, optional): bytes of one block of time steps. Defaults to 512 MB.
+
+        Returns:
+            dict: stat -> (period, ...) array (float64, count int64), a DataArray with the period start times
+                for DataArray input.
+        """
+        for stat in stats:
+            assert stat in AGGREGATE_STATS, "stat must be one of {}, but given {}".format(AGGREGATE_STATS, stat)
+        assert arr.shape[0] == len(self.time), \
+            "Length of time axis [{}] does not match the time coord [{}].".format(arr.shape[0], len(self.time))
+        NTime, shape = arr.shape[0], tuple(arr.shape[1:])
+        NPeriod = len(self)
+
+        total = np.zeros((NPeriod,) + shape) if 'mean' in stats or 'sum' in stats else None
+        count = np.zeros((NPeriod,) + shape, dtype=np.int64)
+        lowest = np.full((NPeriod,) + shape, np.nan) if 'min' in stats else None
+        highest = np.full((NPeriod,) + shape, np.nan) if 'max' in stats else None
+
+        step = max(1, int(memoryBudget // max(1, int(np.prod(shape)) * 8 * 3)))
+        currentSpan().set(periods=NPeriod, step=step)
+        for start in range(0, NTime, step):
+            stop = min(start + step, NTime)
+            # segments in the block, cut at its bounds
+            segment = self.segment[start:stop]
+            localStarts = np.flatnonzero(np.concatenate(([True], segment[1:] != segment[:-1])))
+            period = self.segmentPeriod[segment[localStarts]]
+            isKept = period >= 0
+            if not isKept.any():
+                continue
+            period = period[isKept]
+
+            block = np.asarray(arr[start:stop])
+            isFinite = np.isfinite(block)
+            count[period] += np.add.reduceat(isFinite, localStarts, axis=0, dtype=np.int32)[isKept]
+            if total is not None:
+                # nan to 0 and float64 in one pass
+                filled = np.where(isFinite, block, np.float64(0))
+                total[period] += np.add.reduceat(filled, localStarts, axis=0)[isKept]
+            # fmin / fmax skip nan
+            if lowest is not None:
+                lowest[period] = np.fmin(lowest[period], np.fmin.reduceat(block, localStarts, axis=0)[isKept])
+            if highest is not None:
+                highest[period] = np.fmax(highest[period], np.fmax.reduceat(block, localStarts, axis=0)[isKept])
+
+        isEnough = count >= max(minCount, 1)
+        results = {}
+        for stat in stats:
+            if stat == 'count':
+                results[stat] = count
+            elif stat == 'mean':
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    results[stat] = np.where(isEnough, total / count, np.nan)
+            else:
+                results[stat] = np.where(isEnough, {'sum': total, 'min': lowest, 'max': highest}[stat], np.nan)
+
+        xr = sys.modules.get('xarray')
+        if xr is not None and isinstance(arr, xr.DataArray):
+            timeDim = arr.dims[0]
+            coords = {k: v for k, v in arr.coords.items() if timeDim not in v.dims}
+            coords[timeDim] = self.startTimes
+            results = {stat: xr.DataArray(res, dims=arr.dims, coords=coords, attrs=arr.attrs, name=arr.name)
+                       for stat, res in results.items()}
+        return results
+
+
+def AggregateTime(arr, freq='month', stats=('mean',), time=None, seasons=None, waterYearStart=10, minCount=1,
+                  memoryBudget=DEFAULT_MEMORY_BUDGET):
+    """
+    Aggregate a (time, ...) array in one call, see TimeAggregator. Build a TimeAggregator once to
+    aggregate several arrays with the same time coord.
+
+    Args:
+        arr (_type_): (time, ...) numpy array, np.memmap or xarray.DataArray with time first.
+        time (_type_, optional): time coord. Defaults to the first coord of a DataArray.
+
+    Returns:
+        tuple: (dict of stat -> (period, ...) array, labels of the periods).
+    """
+    if time is None:
+        time = arr[arr.dims[0]].values
+    aggregator = TimeAggregator(time, freq, seasons, waterYearStart)
+    return aggregator.aggregate(arr, stats, minCount, memoryBudget), aggregator.labels
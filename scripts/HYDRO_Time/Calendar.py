@@ -0,0 +1,206 @@
+import sys
+
+import numpy as np
+
+CALENDAR_ALIASES = {
+    'standard'           : 'standard',
+    'gregorian'          : 'standard',
+    'proleptic_gregorian': 'standard',
+    'noleap'             : 'noleap',
+    '365_day'            : 'noleap',
+    '360_day'            : '360_day',
+}
+
+_MONTH_DAYS = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def _calendarName(calendar):
+    assert calendar in CALENDAR_ALIASES, \
+        "calendar must be one of {}, but given {}".format(list(CALENDAR_ALIASES), calendar)
+    return CALENDAR_ALIASES[calendar]
+
+
+def _ymd(date):
+    """
+    (year, month, day) of a 'YYYY-MM-DD' string, a datetime-like or a cftime date.
+    """
+    if isinstance(date, str):
+        y, m, d = date[:10].split('-')
+        return int(y), int(m), int(d)
+    if isinstance(date, np.datetime64):
+        date = date.astype('datetime64[D]').item()
+    return date.year, date.month, date.day
+
+
+def isLeapYear(year):
+    year = np.asarray(year)
+    return (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+
+
+def monthDays(year, calendar='standard'):
+    """
+    (year, 12) days of every month of the years in a calendar.
+    """
+    calendar = _calendarName(calendar)
+    year = np.atleast_1d(year)
+    if calendar == '360_day':
+        return np.full((len(year), 12), 30)
+    days = np.tile(_MONTH_DAYS, (len(year), 1))
+    if calendar == 'standard':
+        days[:, 1] += isLeapYear(year)
+    return days
+
+
+def calendarDates(start, end, calendar='standard'):
+    """
+    Year, month, day and day of year of every day from start to end (included) in a calendar.
+    Days of start and end which do not exist in the calendar (e.g. Feb 30) are moved to the last day of their month.
+
+    Returns:
+        tuple: four 1D int arrays (year, month, day, dayOfYear).
+    """
+    (y0, m0, d0), (y1, m1, d1) = _ymd(start), _ymd(end)
+    years = np.arange(y0, y1 + 1)
+    days = monthDays(years, calendar)
+    d0 = min(d0, days[0, m0 - 1])
+    d1 = min(d1, days[-1, m1 - 1])
+
+    yearLen = days.sum(axis=1)
+    total = yearLen.sum()
+    # day of year and year of every day of the full years, then cut to [start, end]
+    yearStart = np.concatenate(([0], np.cumsum(yearLen)[:-1]))
+    year = np.repeat(years, yearLen)
+    dayOfYear = np.arange(total) - np.repeat(yearStart, yearLen)
+    monthStart = np.concatenate((np.zeros((len(years), 1), dtype=int), np.cumsum(days, axis=1)[:, :-1]), axis=1)
+    month = np.concatenate([np.repeat(np.arange(1, 13), d) for d in days])
+    day = dayOfYear - monthStart[year - y0, month - 1] + 1
+
+    first = monthStart[0, m0 - 1] + d0 - 1
+    last = yearStart[-1] + monthStart[-1, m1 - 1] + d1 - 1
+    assert first <= last, "start must not be after end."
+    sel = slice(first, last + 1)
+    return year[sel], month[sel], day[sel], dayOfYear[sel]
+
+
+def conversionIndex(start, end, source, target, method='linear'):
+    """
+    For every day from start to end in the target calendar, the position in the daily series
+    of the source calendar, as two gather indices and the interpolation weight of the second one.
+    Between standard and noleap, days are matched by date: Feb 29 is dropped, or inserted as the mean
+    of Feb 28 and Mar 1. With 360_day, the days of a year are stretched linearly over the target year.
+
+    Args:
+        start (_type_): first day, 'YYYY-MM-DD', datetime-like or cftime.
+        end (_type_): last day (included).
+        source (str): calendar of the data, 'standard', 'noleap' or '360_day' (and aliases).
+        target (str): calendar of the output.
+        method (str, optional): 'linear' interpolation between the two days, or 'nearest' day. Defaults to 'linear'.
+
+    Returns:
+        tuple: (index, nextIndex, weight) 1D arrays of the length of the target series.
+    """
+    assert method in ['linear', 'nearest']
+    source, target = _calendarName(source), _calendarName(target)
+    ys, ms, ds, doys = calendarDates(start, end, source)
+    yt, mt, dt, doyt = calendarDates(start, end, target)
+    NSource = len(ys)
+
+    if '360_day' not in [source, target]:
+        sourceKey = ys * 10000 + ms * 100 + ds
+        targetKey = yt * 10000 + mt * 100 + dt
+        pos = np.searchsorted(sourceKey, targetKey).astype(np.float64)
+        isMissing = sourceKey[np.minimum(pos, NSource - 1).astype(int)] != targetKey
+        # a day missing in the source (Feb 29) lies between its neighbours
+        pos[isMissing] -= 0.5
+    else:
+        years = np.arange(ys[0], ys[-1] + 1)
+        sourceLen = monthDays(years, source).sum(axis=1)
+        targetLen = monthDays(years, target).sum(axis=1)
+        # index of the (possibly cut) first day of every year in the source series
+        yearBase = np.zeros(len(years), dtype=np.int64)
+        yearBase[ys - years[0]] = np.arange(NSource) - doys
+        k = yt - years[0]
+        pos = yearBase[k] + (doyt + 0.5) * sourceLen[k] / targetLen[k] - 0.5
+    pos = np.clip(pos, 0, NSource - 1)
+
+    if method == 'nearest':
+        pos = np.floor(pos + 0.5)
+    index = np.floor(pos).astype(np.int64)
+    weight = pos - index
+    weight[weight < 1e-9] = 0
+    return index, np.minimum(index + 1, NSource - 1), weight
+
+
+def gatherInterpolate(data, index, nextIndex, weight, axis=0):
+    """
+    data[index] * (1 - weight) + data[nextIndex] * weight along axis, keeping the dtype (integers are rounded).
+    NumPy arrays are gathered once and only the steps with a weight are interpolated,
+    other arrays (dask...) are computed lazily with two gathers.
+    """
+    dtype = data.dtype
+    shape = [1] * len(data.shape)
+    shape[axis] = -1
+
+    def blend(a, b, w):
+        w = w.reshape(shape)
+        # steps without weight keep a, even if b is nan
+        res = np.where(w > 0, a + (b - a) * w, a)
+        if np.issubdtype(dtype, np.integer):
+            res = np.rint(res)
+        return res.astype(dtype)
+
+    if not isinstance(data, np.ndarray):
+        if not weight.any():
+            return np.take(data, index, axis=axis)
+        return blend(np.take(data, index, axis=axis), np.take(data, nextIndex, axis=axis), weight)
+
+    out = np.take(data, index, axis=axis)
+    frac = np.flatnonzero(weight)
+    if len(frac):
+        sel = (slice(None),) * (axis % len(data.shape)) + (frac,)
+        out[sel] = blend(np.take(data, index[frac], axis=axis).astype(np.float64),
+                         np.take(data, nextIndex[frac], axis=axis), weight[frac])
+    return out
+
+
+def convertCalendar(arr, source, target, start=None, end=None, method='linear', axis=0):
+    """
+    Convert a daily series (of any shape) from a calendar to another one, e.g. noleap model output to standard.
+
+    Args:
+        arr (_type_): numpy, dask or xarray.DataArray array with a daily time axis.
+        source (str): calendar of arr, 'standard', 'noleap' or '360_day' (and aliases).
+        target (str): calendar of the output.
+        start (_type_, optional): first day of arr, 'YYYY-MM-DD', datetime-like or cftime. Defaults to the first time of a DataArray.
+        end (_type_, optional): last day of arr. Defaults to the last time of a DataArray.
+        method (str, optional): 'linear' or 'nearest', see conversionIndex. Defaults to 'linear'.
+        axis (int, optional): time axis of numpy/dask arrays (a DataArray uses its 'time' dim, or the first one). Defaults to 0.
+
+    Returns:
+        _type_: same type and dtype as arr, a DataArray gets the time coord of the target calendar.
+    """
+    xr = sys.modules.get('xarray')
+    isDataArray = xr is not None and isinstance(arr, xr.DataArray)
+    if isDataArray:
+        timeDim = 'time' if 'time' in arr.dims else arr.dims[0]
+        axis = arr.dims.index(timeDim)
+        if start is None:
+            start = arr[timeDim].values[0]
+        if end is None:
+            end = arr[timeDim].values[-1]
+    assert start is not None and end is not None, "start and end are needed for arrays without time coord."
+
+    index, nextIndex, weight = conversionIndex(start, end, source, target, method)
+    assert arr.shape[axis] == len(calendarDates(start, end, source)[0]), \
+        "Length of time axis [{}] does not match the days from {} to {} in {} calendar.".format(
+            arr.shape[axis], start, end, source)
+    if not isDataArray:
+        return gatherInterpolate(arr, index, nextIndex, weight, axis)
+
+    data = gatherInterpolate(arr.data, index, nextIndex, weight, axis)
+    y, m, d, _ = calendarDates(start, end, target)
+    time = xr.date_range('{:04d}-{:02d}-{:02d}'.format(y[0], m[0], d[0]), periods=len(y), freq='D',
+                         calendar=_calendarName(target), use_cftime=_calendarName(target) != 'standard')
+    coords = {k: v for k, v in arr.coords.items() if timeDim not in v.dims}
+    coords[timeDim] = time
+    return xr.DataArray(data, dims=arr.dims, coords=coords, attrs=arr.attrs, name=arr.name)
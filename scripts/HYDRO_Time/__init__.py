@@ -1 +1,4 @@
-__version__ = '1.0'
\ No newline at end of file
+__version__ = '1.0'
+
+from .Calendar import convertCalendar, conversionIndex, calendarDates, gatherInterpolate
+from .Aggregate import TimeAggregator, AggregateTime
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+
+@pytest.fixture
+def trendCube():
+    """
+    (time, lat, lon) float64 cube of trends with noise, and pixels covering the edge cases of trend1D:
+    scattered nan, values rounded to give ties, all-zero, mostly nan and constant series.
+    """
+    rng = np.random.default_rng(0)
+    NTime, NLat, NLon = 24, 4, 6
+    arr = rng.standard_normal((NTime, NLat, NLon)) + np.linspace(0, 2, NTime)[:, np.newaxis, np.newaxis]
+    arr[rng.random(arr.shape) < 0.1] = np.nan
+    arr[:, 0, :3] = np.round(arr[:, 0, :3])
+    arr[:, 1, 0] = 0
+    arr[:NTime // 2 + 1, 1, 1] = np.nan
+    arr[:, 1, 2] = 3.0
+    arr[:5, 1, 3] = np.inf
+    return arr
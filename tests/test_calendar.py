@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from HYDRO_Time.Calendar import calendarDates, convertCalendar, gatherInterpolate
+
+da = pytest.importorskip('dask.array')
+
+
+def test_gatherInterpolateDaskMatchesNumpy():
+    # the nan neighbour of a weight-0 step must not leak into it
+    data = np.array([8., 9., np.nan, 11., 12.])
+    index, nextIndex = np.array([0, 1, 2, 3]), np.array([1, 2, 3, 4])
+    weight = np.array([0, 0, 0, 0.5])
+    ref = gatherInterpolate(data, index, nextIndex, weight)
+    np.testing.assert_array_equal(ref, [8, 9, np.nan, 11.5])
+    np.testing.assert_array_equal(gatherInterpolate(da.from_array(data, chunks=2), index, nextIndex, weight).compute(), ref)
+
+
+@pytest.mark.parametrize('source, target', [('noleap', 'standard'), ('360_day', 'standard'), ('standard', '360_day')])
+def test_convertCalendarDaskMatchesNumpy(source, target):
+    NDay = len(calendarDates('2000-01-01', '2001-12-30', source)[0])
+    rng = np.random.default_rng(0)
+    arr = rng.standard_normal((NDay, 3))
+    arr[rng.random(arr.shape) < 0.1] = np.nan
+    ref = convertCalendar(arr, source, target, '2000-01-01', '2001-12-30')
+    res = convertCalendar(da.from_array(arr, chunks=(100, 3)), source, target, '2000-01-01', '2001-12-30')
+    np.testing.assert_array_equal(res.compute(), ref)
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+xr = pytest.importorskip('xarray')
+
+from HYDRO_Generator.GetDsElement import GetDatasetElement
+
+GRIDS = {'0-360': np.arange(0.5, 360, 1.0), '-180-180': np.arange(-179.5, 180, 1.0)}
+
+
+def gridDataset(lon):
+    return xr.Dataset({'v': (('lat', 'lon'), np.zeros((3, len(lon))))}, coords={'lat': [1.0, 0.0, -1.0], 'lon': lon})
+
+
+@pytest.mark.parametrize('grid', list(GRIDS))
+@pytest.mark.parametrize('lonRange, expected', [
+    ((0, 360), np.arange(0.5, 360, 1.0)),
+    ((-180, 180), np.arange(-179.5, 180, 1.0)),
+    ((90, 270), np.arange(90.5, 270, 1.0)),
+    ((-90, 90), np.arange(-89.5, 90, 1.0)),
+    ((170, -170), np.arange(170.5, 190, 1.0)),
+    ((0, 90), np.arange(0.5, 90, 1.0)),
+])
+def test_lonRangeInBothConventions(grid, lonRange, expected):
+    _, _, _, lon = GetDatasetElement(gridDataset(GRIDS[grid]), lonRange=lonRange)
+    # same cells whatever the conventions of the grid and of lonRange
+    np.testing.assert_array_equal(np.sort(lon % 360), np.sort(expected % 360))
@@ -0,0 +1,100 @@
+import warnings
+
+import numpy as np
+import pytest
+
+pytest.importorskip('scipy')
+
+from HYDRO_Stats import TrendDetector
+from HYDRO_Stats.TrendKernels import RESULT_KEYS
+
+
+def trend1DMaps(detector, arr):
+    """
+    trend1D of every pixel, as (lat, lon) maps keyed by RESULT_KEYS.
+    """
+    NTime, NLat, NLon = arr.shape
+    out = {key: np.full((NLat, NLon), np.nan) for key in RESULT_KEYS}
+    with warnings.catch_warnings():
+        # statsmodels warns about the constant series
+        warnings.simplefilter('ignore')
+        for i in range(NLat):
+            for j in range(NLon):
+                res = detector.trend1D(arr[:, i, j])
+                for key in RESULT_KEYS:
+                    out[key][i, j] = res[key]
+    return out
+
+
+def longCube():
+    """
+    40-step cube, more than 33 values: normal approximation of the Mann-Kendall test, with ties in the first row.
+    """
+    rng = np.random.default_rng(1)
+    arr = rng.standard_normal((40, 2, 3)) + np.linspace(0, 1, 40)[:, np.newaxis, np.newaxis]
+    arr[:, 0] = np.round(arr[:, 0])
+    arr[rng.random(arr.shape) < 0.1] = np.nan
+    return arr
+
+
+def assertMapsClose(res, ref, rtol=1e-5, atol=1e-8):
+    for key in RESULT_KEYS:
+        np.testing.assert_allclose(np.asarray(res[key], dtype=np.float64), ref[key], rtol=rtol, atol=atol,
+                                   equal_nan=True, err_msg=key)
+
+
+def test_linearTrend3DMatchesTrend1D(trendCube):
+    pytest.importorskip('statsmodels.formula.api')
+    detector = TrendDetector('linear')
+    assertMapsClose(detector.trend3D(trendCube), trend1DMaps(detector, trendCube))
+
+
+def test_linearTrend3DSmallBlocks(trendCube):
+    detector = TrendDetector('linear')
+    ref = detector.trend3D(trendCube)
+    res = detector.trend3D(trendCube, memoryBudget=1)
+    for key in RESULT_KEYS:
+        np.testing.assert_array_equal(res[key], ref[key], err_msg=key)
+
+
+def test_senTrend3DMatchesTrend1D(trendCube):
+    detector = TrendDetector('sen')
+    assertMapsClose(detector.trend3D(trendCube), trend1DMaps(detector, trendCube))
+
+
+def test_senTrend3DLongSeriesMatchesTrend1D():
+    arr = longCube()
+    detector = TrendDetector('sen')
+    assertMapsClose(detector.trend3D(arr), trend1DMaps(detector, arr))
+
+
+@pytest.mark.parametrize('method', ['linear', 'sen'])
+def test_parallelTrend3DEqualsSerial(trendCube, method):
+    detector = TrendDetector(method)
+    ref = detector.trend3D(trendCube)
+    # several blocks per worker
+    res = detector.trend3D(trendCube, memoryBudget=1, nWorkers=2)
+    for key in RESULT_KEYS:
+        np.testing.assert_array_equal(res[key], ref[key], err_msg=key)
+
+
+def test_parallelTrend3DAfterNumbaThreads(trendCube):
+    # workers used to be forked from a process running numba's threading layer and hang
+    from HYDRO_Stats.NumbaKernels import numbaAvailable
+    if not numbaAvailable():
+        pytest.skip('numba is not available')
+    TrendDetector('sen', 'numba').trend3D(trendCube)
+    detector = TrendDetector('sen')
+    res = detector.trend3D(trendCube, memoryBudget=1, nWorkers=2)
+    np.testing.assert_array_equal(res['slope'], detector.trend3D(trendCube)['slope'])
+
+
+@pytest.mark.parametrize('method', ['linear', 'sen'])
+def test_numbaTrend3DMatchesNumpy(trendCube, method):
+    from HYDRO_Stats.NumbaKernels import numbaAvailable
+    if not numbaAvailable():
+        pytest.skip('numba is not available')
+    for arr in [trendCube, longCube()]:
+        ref = TrendDetector(method).trend3D(arr)
+        res = TrendDetector(method, 'numba').trend3D(arr)
+        assertMapsClose(res, ref, rtol=1e-6)